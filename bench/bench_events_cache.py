@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import pickle
+import random
+import argparse
+from zoneinfo import ZoneInfo
+from datetime import datetime as dt
+from datetime import timedelta
+from datetime import timezone
+
+# the bench scripts live outside of bin, so make talonlib importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+
+import talonlib
+
+# values the detection cache has to give back exactly as they went in
+EDGE_STRINGS = [None, '', 'Grive à dos olive', 'ヒガラ', 'Swainson\'s Thrush', 'trailing\x00']
+
+def ParseCommandLineArguments():
+    arg_parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, description="Benchmark the detection cache serialization and check that it round trips.")
+    arg_parser.add_argument('-n', '--count', default=100000, type=int, help="Number of detections in the synthetic store.")
+    arg_parser.add_argument('-r', '--repeat', default=5, type=int, help="Number of times to serialize the store with each method.")
+
+    return arg_parser
+
+def build_events(count):
+    rng = random.Random(0)
+    tzs = [ZoneInfo('US/Eastern'), ZoneInfo('UTC'), timezone(timedelta(hours=-4), 'EDT'), None]
+    start = dt(2025, 9, 16)
+    events = []
+
+    for i in range(count):
+        offset = rng.uniform(0, 3600)
+        edge = EDGE_STRINGS[i % len(EDGE_STRINGS)]
+        tz = tzs[i % len(tzs)]
+
+        event = {
+            'filename': f"RPI1_20250916_{i // 1000:06d}-0400.WAV",
+            'dt': (start + timedelta(seconds=offset)).replace(tzinfo=tz),
+            'start': offset,
+            'stop': offset + 1,
+            'engine': rng.choice(['nh', 'bn', 'ta']),
+            'species_code': edge if i % 7 == 0 else rng.choice(['swathr', 'grcthr', 'sora']),
+            'common_name': edge,
+            'probability': rng.random(),
+            'disposition': rng.choice(['unconfirmed', 'confirmed', 'excluded']),
+            'station': 'RPI1',
+            'uid': i,
+        }
+
+        # fields without a column of their own, and a start_rel which doesn't
+        # match start, are kept on the side
+        if i % 11 == 0:
+            event['note'] = edge
+
+        if i % 13 == 0:
+            event['start_rel'] = 'manual'
+
+        events.append(event)
+
+    return talonlib.TalonEvents(events)
+
+def records(events):
+    return [(sorted(event.keys()), [(key, type(event[key]), event[key]) for key in sorted(event.keys())]) for event in events]
+
+def run(label, repeat, func):
+    times = []
+
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+
+    print(f"{label:<28} {min(times) * 1000:9.1f} ms")
+
+    return result
+
+def main():
+    args = ParseCommandLineArguments().parse_args()
+    events = build_events(args.count)
+    expected = records(events)
+
+    print(f"{len(events)} detections")
+    print('-' * 60)
+
+    blob = run('to_bytes', args.repeat, events.to_bytes)
+    cached = run('from_bytes', args.repeat, lambda: talonlib.TalonEvents.from_bytes(blob))
+    data = run('pickle.dumps', args.repeat, lambda: pickle.dumps(events))
+    pickled = run('pickle.loads', args.repeat, lambda: pickle.loads(data))
+
+    print(f"{'cache size':<28} {len(blob) / 1024:9.1f} KB  (pickle {len(data) / 1024:.1f} KB)")
+
+    if records(pickled) != expected:
+        print("ERROR: pickle round trip differs from the original store")
+        return 1
+
+    if records(cached) != expected:
+        print("ERROR: detection cache round trip differs from the original store")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
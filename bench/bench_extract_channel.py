@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import struct
+import argparse
+import tempfile
+
+# the bench scripts live outside of bin, so make talonlib importable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+
+import talonlib
+
+def ParseCommandLineArguments():
+    arg_parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, description="Benchmark TalonWAVFile channel extraction engines.")
+    arg_parser.add_argument('-s', '--size', default=64, type=int, help="Size, in MB, of the synthetic WAV file to split.")
+    arg_parser.add_argument('-n', '--channels', default=2, type=int, help="Number of channels in the synthetic WAV file.")
+    arg_parser.add_argument('-b', '--bits', default=[16, 24, 32], type=int, nargs='+', choices=[16, 24, 32], help="Bit depths to benchmark.")
+    arg_parser.add_argument('--float', action='store_true', help="Use 32-bit IEEE float instead of 32-bit PCM.")
+    arg_parser.add_argument('--skip-loop', action='store_true', help="Don't benchmark the original loop engine (it's slow on large files).")
+
+    return arg_parser
+
+def write_wav(path, size, channels, bits, fmt_tag):
+    bpc = bits // 8
+    block = bpc * channels
+    rate = 48000
+    data_size = (size // block) * block
+
+    with open(path, 'wb') as f:
+        f.write(b'RIFF')
+        f.write(struct.pack('<L', 4 + 8 + 16 + 8 + data_size))
+        f.write(b'WAVE')
+        f.write(b'fmt ')
+        f.write(struct.pack('<LHHLLHH', 16, fmt_tag, channels, rate, rate * block, block, bits))
+        f.write(b'data')
+        f.write(struct.pack('<L', data_size))
+
+        chunk = os.urandom(1 << 20)
+        remaining = data_size
+
+        while remaining > 0:
+            f.write(chunk[:remaining])
+            remaining -= len(chunk)
+
+def data_chunk(path):
+    twf = talonlib.TalonWAVFile(path)
+    data = twf.metadata['chunks']['data']
+    block_size = twf.metadata['chunks']['fmt']['block_size']
+
+    # only whole frames, the loop engine doesn't write the RIFF pad byte
+    # which follows an odd sized data chunk
+    with open(path, 'rb') as f:
+        f.seek(data['offset'] + 8)
+        return f.read(data['size'] // block_size * block_size)
+
+def run(label, size, func, outputs):
+    for outfile in outputs:
+        if os.path.exists(outfile):
+            os.remove(outfile)
+
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    print(f"{label:<28} {elapsed:8.3f}s  {size / 1024 / 1024 / elapsed:9.2f} MB/s")
+
+def main():
+    args = ParseCommandLineArguments().parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for bits in args.bits:
+            fmt_tag = 3 if (bits == 32 and args.float) else 1
+            wavfile = os.path.join(tmpdir, f"BENCH_{bits}.WAV")
+            outputs = [os.path.join(tmpdir, f"BENCH_{bits}-{c}.WAV") for c in range(args.channels)]
+
+            write_wav(wavfile, args.size * 1024 * 1024, args.channels, bits, fmt_tag)
+            size = os.stat(wavfile).st_size
+
+            print(f"\n{bits}-bit {'float' if fmt_tag == 3 else 'PCM'}, {args.channels} channels, {size / 1024 / 1024:.2f}MB")
+            print('-' * 60)
+
+            twf = talonlib.TalonWAVFile(wavfile)
+
+            if not args.skip_loop:
+                run('loop (channel 0)', size, lambda: twf.ExtractChannel(0, quiet=True, engine='loop'), outputs)
+                expected = data_chunk(outputs[0])
+            else:
+                expected = None
+
+            run('mmap (channel 0)', size, lambda: twf.ExtractChannel(0, quiet=True, engine='mmap'), outputs)
+
+            if expected is not None and data_chunk(outputs[0]) != expected:
+                print("ERROR: mmap output differs from loop output")
+                sys.exit(1)
+
+            run('mmap (all channels)', size, lambda: twf.ExtractChannels(None, quiet=True), outputs)
+
+            for outfile in outputs + [wavfile]:
+                if os.path.exists(outfile):
+                    os.remove(outfile)
+
+if __name__ == "__main__":
+    main()
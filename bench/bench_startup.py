@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin')
+
+def ParseCommandLineArguments():
+    arg_parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, description="Benchmark the cold start time of the CLI tools and fail if it exceeds a budget.")
+    arg_parser.add_argument('-n', '--count', default=10, type=int, help="Number of times to start each tool.")
+    arg_parser.add_argument('-b', '--budget', default=200, type=float, help="Maximum median start up time, in milliseconds, beyond that of a bare interpreter.")
+    arg_parser.add_argument('-t', '--tools', nargs='+', default=['tlist', 'talon'], help="Tools to start with --help.")
+    arg_parser.add_argument('--imports', default=0, type=int, help="Also list this many of the slowest modules imported by talonlib.")
+
+    return arg_parser
+
+def start_time(command, count):
+    # the median of several runs, each in a fresh interpreter
+    times = []
+
+    for i in range(count):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, cwd=BIN_DIR)
+        times.append(time.perf_counter() - start)
+
+    return statistics.median(times) * 1000
+
+def slowest_imports(count):
+    # -X importtime reports the cumulative time of each import on stderr, a
+    # module's imports are listed before it so talonlib's are the lines since
+    # the previous top level import (e.g., those made by site)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import talonlib'], capture_output=True, text=True, check=True, cwd=BIN_DIR)
+    imports = []
+
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+
+        name = fields[2][1:]
+        imports.append((int(fields[1]), name.strip()))
+
+        if not name.startswith(' '):
+            if name == 'talonlib':
+                break
+
+            imports = []
+
+    return sorted(imports, reverse=True)[:count]
+
+def main():
+    args = ParseCommandLineArguments().parse_args()
+    failed = False
+
+    bare = start_time([sys.executable, '-c', 'pass'], args.count)
+    print(f"{'python':<12} {bare:8.1f} ms")
+
+    for tool in args.tools:
+        elapsed = start_time([sys.executable, os.path.join(BIN_DIR, tool), '--help'], args.count)
+        over = elapsed - bare
+        status = 'ok' if over <= args.budget else 'OVER BUDGET'
+        failed = failed or over > args.budget
+
+        print(f"{tool:<12} {elapsed:8.1f} ms  (+{over:.1f} ms, budget {args.budget:.0f} ms)  {status}")
+
+    if args.imports:
+        print()
+
+        for usec, name in slowest_imports(args.imports):
+            print(f"{usec / 1000:8.1f} ms  {name}")
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
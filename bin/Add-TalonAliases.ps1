@@ -11,6 +11,11 @@ function talon-gui {
     Invoke-Expression ("$env:VIRTUAL_ENV" + "\Scripts\python.exe" + " " + "$bindir" + "talon-gui" + " " + "-c $etcdir" + "talon.ini" + " " + "$curargs")
 }
 
+function tindex {
+    $curargs = $args -join " "
+    Invoke-Expression ("$env:VIRTUAL_ENV" + "\Scripts\python.exe" + " " + "$bindir" + "tindex" + " " + $curargs)
+}
+
 function tlist {
     $curargs = $args -join " "
     Invoke-Expression ("$env:VIRTUAL_ENV" + "\Scripts\python.exe" + " " + "$bindir" + "tlist" + " " + "-c $etcdir" + "talon.ini" + " " + $curargs)
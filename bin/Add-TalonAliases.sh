@@ -8,6 +8,7 @@ inidir=$(dirname $SCRIPT_DIR)
 
 alias talon="$bindir/talon -c $inidir/talon.ini"
 alias talon-gui="$bindir/talon-gui -c $inidir/talon.ini"
+alias tindex="$bindir/tindex"
 alias tlist="$bindir/tlist -c $inidir/talon.ini"
 alias tmdupdate="$bindir/tmdupdate -c $inidir/talon.ini"
 alias trecord="$bindir/trecord -c $inidir/talon.ini"
@@ -5,3 +5,4 @@ Remove-Item Function:tweather
 Remove-Item Function:trecord
 Remove-Item Function:tsplit
 Remove-Item Function:tlist
+Remove-Item Function:tindex
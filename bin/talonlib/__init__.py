@@ -3,107 +3,142 @@ import csv
 import sys
 import json
 import glob
-import ephem
 import signal
 import codecs
-import guano
 import struct
-import requests
-import configparser
-from astral.sun import sun
-from astral import LocationInfo
+import sqlite3
+import threading
 from pathlib import Path
 from zoneinfo import ZoneInfo
+from datetime import date
 from datetime import time
 from datetime import timedelta
+from datetime import timezone
 from datetime import datetime as dt
 
 class Talon:
+    # the x-axis keeps its half hour ticks for a night's recordings, anything
+    # longer lets matplotlib choose so the labels don't run together
+    HALF_HOUR_TICKS = timedelta(hours=18)
+
+    # eBird's names for the schedule's protocols in the record format
+    EBIRD_PROTOCOLS = {'NFC': 'Nocturnal Flight Call Count', 'DAY': 'Stationary'}
+
     def __init__(self):
         pass
 
-    def generate_timeseries_graph(self, events: list, outfile="timeseries.png", frequency=5, ymax=None):
+    def bucket_events(self, events, frequency=5, series=None, max_series=10):
+        """
+        Count events into frequency minute buckets, from the top of the hour of the
+        first event through the hour after the last.
+
+        Args:
+            events (TalonEvents): The events to count (a list of event dicts also works).
+            frequency (int): The time duration (minutes) we'll lump events into.
+            series (str): An event key (e.g., 'protocol' or 'common_name') to count
+                each of its values separately, None counts every event together.
+            max_series (int): The most values to count separately, the least
+                frequent of the rest are counted together as 'other'.
+
+        Returns:
+            tuple: The datetime each bucket starts at, the names of the series, and
+            a numpy array of counts with a row per series and a column per bucket.
+        """
+        import numpy as np
+
+        if frequency <= 0:
+            raise ValueError(f"Invalid frequency: {frequency}")
+
+        if not isinstance(events, TalonEvents):
+            events = TalonEvents(events)
+
+        stamps = events.column('dt')
+        start_dt = events[int(stamps.argmin())]['dt']
+        stop_dt = events[int(stamps.argmax())]['dt']
+
+        start = start_dt.replace(minute=0, second=0, microsecond=0)
+        stop = stop_dt.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1, minutes=frequency)
+
+        numbuckets = int(((stop - start).total_seconds() / 60) / frequency)
+        interval = timedelta(minutes=frequency)
+
+        # a bucket covers [its start, the next bucket's start), the edges are
+        # taken from the bucket datetimes so they follow the wall clock across
+        # daylight saving changes just as comparing the datetimes did
+        buckets = [start + interval * i for i in range(numbuckets)]
+        edges = np.asarray([events.epoch(bucket) for bucket in buckets] + [events.epoch(buckets[-1] + interval)], dtype=np.int64)
+        index = np.searchsorted(edges, stamps, side='right') - 1
+        inside = (index >= 0) & (index < numbuckets)
+
+        if series is None:
+            return buckets, ['all'], np.bincount(index[inside], minlength=numbuckets)[np.newaxis, :]
+
+        codes, inverse = np.unique(events.column(series), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse[inside] * numbuckets + index[inside], minlength=len(codes) * numbuckets).reshape(len(codes), numbuckets)
+        names = [events._strings[c] if c >= 0 else 'unknown' for c in codes.tolist()]
+
+        # keep the most frequent values and lump the rest together
+        order = np.argsort(-counts.sum(axis=1), kind='stable')
+
+        if len(order) > max_series:
+            rest = counts[order[max_series - 1:]].sum(axis=0)
+            order = order[:max_series - 1]
+
+            return buckets, [names[i] for i in order] + ['other'], np.vstack([counts[order], rest])
+
+        return buckets, [names[i] for i in order], counts[order]
+
+    @staticmethod
+    def rolling_average(counts):
+        """
+        Average each bucket with its neighbors, the first and last buckets are 0.
+        """
+        import numpy as np
+
+        counts = np.atleast_2d(counts)
+        rollavg = np.zeros(counts.shape, dtype=np.float64)
+
+        for row, totals in enumerate(counts):
+            if totals.size > 2:
+                rollavg[row, 1:-1] = np.convolve(totals, np.ones(3, dtype=totals.dtype), mode='valid') / 3
+
+        return rollavg
+
+    def generate_timeseries_graph(self, events, outfile="timeseries.png", frequency=5, ymax=None, series=None):
         """
         Generate a frequency graph of supplied events.
 
         Args:
-            events (list): A list of event dicts which we'll use to generate the graph.
-            start_dt (datetime): The start time of data we wish to graph.
-            stop_dt (datetime): The stop time of data we wish to graph.
-            frequency (int): The time duration (minutes) we'll lump events into for the graph. 
-            title (str): The title of the graph.
+            events (TalonEvents): The events to graph (a list of event dicts also works).
+            outfile (str): Where to save the graph.
+            frequency (int): The time duration (minutes) we'll lump events into for the graph.
             ymax (int): Maximum height of the chart (minimum is the bucket with the most events).
-            tz (str): The time zone of the data.
+            series (str): Draw a stacked line per value of this event key (e.g., 'protocol'
+                or 'common_name') instead of a single line.
         """
         import math
         import matplotlib
         import matplotlib.pyplot as plt
-        import matplotlib.ticker as tck
         import matplotlib.dates as mdates
 
         matplotlib.use('agg')
 
-        rollavg = []
-        buckets = []
-        totals = []
-        labels = []
-
-        evts = sorted(events, key=lambda d: d['dt'])
-        start_dt = evts[0]['dt']
-        stop_dt = evts[-1]['dt']
-        
-        title = ''
+        buckets, names, counts = self.bucket_events(events, frequency, series)
+        rollavg = self.rolling_average(counts)
+        labels = buckets
 
-        # TODO: maxticks is 1000, so we need to ensure that we don't generate more than 1000 ticks
-        # 
         if ymax is None:
             max_value = 0
         else:
             max_value = ymax
 
-        # create the frequency buckets before we iterate events
-        if frequency > 0:
-            start = start_dt.replace(minute=0, second=0, microsecond=0)
-            stop = stop_dt.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1, minutes=frequency)
-
-            # TODO: need to adjust numbuckets to under 1000 which is maxticks,
-            # need to adjust interval accordingly
-            numbuckets = int(((stop - start).total_seconds() / 60) / frequency)
-            interval = timedelta(minutes=frequency)
-
-            # zero out start date so we can start on the hour and have our
-            # x-axis labels look nice
-            # cur = start_dt.replace(minute=0, second=0, microsecond=0)
-
-            # initialize buckets
-            for i in range(0, numbuckets):
-                buckets.append(start)
-                totals.append(0)
+        peak = rollavg.sum(axis=0).max()
 
-                tmp = start + interval
+        if peak > max_value:
+            max_value = math.ceil(peak / 10.0) * 10
 
-                for event in evts:
-                    if event['dt'] >= start and event['dt'] < tmp:
-                        totals[i] += 1
-
-                start = tmp
-
-            # add datetime labels
-            for bucket in buckets:
-                labels.append(bucket)
-
-        for i in range(numbuckets):
-            # handle averaging the starting and ending buckets by making them 0
-            if i == 0 or i == numbuckets-1:
-                rollavg.append(0)
-            else:
-                rollavg.append((totals[i-1] + totals[i] + totals[i+1])/3)
-
-        for i in rollavg:
-            if i > max_value:
-                max_value = math.ceil(i / 10.0) * 10
-
-        title += f"{frequency * 3}-Minute Rolling Average"
+        title = f"{frequency * 3}-Minute Rolling Average"
         title += f"\n{buckets[0].strftime('%m/%d/%Y %H:%M:%S%z')} - {buckets[-1].strftime('%m/%d/%Y %H:%M:%S%z')}"
 
         fig, ax = plt.subplots(figsize=(32, 18))
@@ -116,27 +151,137 @@ class Talon:
         # plt.xlim(buckets[0], buckets[-1])
         plt.rcParams['timezone'] = 'US/Eastern'
 
-        # Format the x-axis labels as dates
-        # date_format = mdates.DateFormatter("%H:%M:%S", tz=pytz.timezone(tz))
-        date_format = mdates.DateFormatter("%H:%M:%S")
-        ax.xaxis.set_major_formatter(date_format)
-
-        # TODO: For long time periods, switch to using hourlocator instead,
-        # maybe try and keep the x-labels fewer than 30.
-        # ax.xaxis.set_major_locator(mdates.HourLocator(byhour=2,interval=1))
-        ax.xaxis.set_major_locator(mdates.MinuteLocator(byminute=[0,30]))
+        # Format the x-axis labels as dates, with the day once they span more
+        # than a night
+        if buckets[-1] - buckets[0] <= self.HALF_HOUR_TICKS:
+            ax.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S"))
+            ax.xaxis.set_major_locator(mdates.MinuteLocator(byminute=[0,30]))
+        else:
+            ax.xaxis.set_major_formatter(mdates.DateFormatter("%m/%d %H:%M"))
+            ax.xaxis.set_major_locator(mdates.AutoDateLocator(minticks=10, maxticks=30))
 
         plt.xlabel('Time', fontsize=24, labelpad=30)
         plt.ylabel('Detections', fontsize=24, labelpad=30)
         plt.title(title, fontsize=32, pad=30)
         plt.xticks(fontsize=16, rotation=60)
         plt.yticks(fontsize=16)
-        plt.plot(labels, rollavg)
-        plt.fill_between(labels, rollavg, alpha=0.3)
+
+        if series is None:
+            plt.plot(labels, rollavg[0])
+            plt.fill_between(labels, rollavg[0], alpha=0.3)
+        else:
+            plt.stackplot(labels, rollavg, labels=names, alpha=0.6)
+            plt.legend(loc='upper left', fontsize=16)
 
         plt.savefig(outfile, pad_inches=0.5, bbox_inches='tight')
         plt.close()
 
+    def checklists(self, events, latitude, longitude, timezone, location):
+        """
+        Assign events to the checklist windows of a TalonSchedule, starting at
+        midnight of the first event's date. Windows and events are both in time
+        order, so each window takes the run of events that follows the previous
+        one's.
+
+        Args:
+            events (TalonEvents): The events to count (a list of event dicts also works).
+            latitude (str): The station's latitude.
+            longitude (str): The station's longitude.
+            timezone (str): The station's time zone, windows follow its days.
+            location (str): The location name passed to the schedule.
+
+        Yields:
+            dict: The start, stop, protocol, and species ((common name, species code)
+            -> detections) of each window with detections.
+        """
+        import numpy as np
+
+        if not isinstance(events, TalonEvents):
+            events = TalonEvents(events)
+
+        if len(events) == 0:
+            return
+
+        stamps = events.column('dt')
+
+        if (np.diff(stamps) < 0).any():
+            events = events.sorted('dt')
+            stamps = events.column('dt')
+
+        # one key per (common name, species code) pair so a window's species
+        # can be counted with a single np.unique
+        base = len(TalonEvents._strings) + 1
+        keys = (events.column('common_name').astype(np.int64) + 1) * base + events.column('species_code') + 1
+
+        curtz = ZoneInfo(timezone)
+        start_date = dt.combine(events[0]['dt'].astimezone(curtz).date(), time(0,0,0), tzinfo=curtz)
+        last = int(stamps[-1])
+        pos = 0
+
+        for window in TalonSchedule(latitude, longitude, timezone, location, start_date):
+            start = events.epoch(window['start'])
+
+            if start > last:
+                break
+
+            # windows are contiguous, so there's nothing before start that an
+            # earlier window didn't already take
+            pos += int(np.searchsorted(stamps[pos:], start, side='left'))
+            stop = pos + int(np.searchsorted(stamps[pos:], events.epoch(window['stop']), side='left'))
+
+            if stop == pos:
+                continue
+
+            codes, counts = np.unique(keys[pos:stop], return_counts=True)
+            species = {}
+
+            for code, count in zip(codes.tolist(), counts.tolist()):
+                common, species_code = divmod(code, base)
+                names = tuple(TalonEvents._strings[c - 1] if c > 0 else None for c in (common, species_code))
+                species[names] = count
+
+            pos = stop
+
+            yield {
+                'start': window['start'].replace(microsecond=0),
+                'stop': window['stop'].replace(microsecond=0),
+                'protocol': window['protocol'],
+                'species': species
+            }
+
+    def ebird_rows(self, checklists, location, latitude, longitude, state='', country=''):
+        """
+        Generate the rows of an eBird Record Format (Extended) CSV, one per species
+        per checklist, which eBird's import tool turns into one checklist per
+        distinct location/date/start time.
+
+        Args:
+            checklists (iterable): Checklists as generated by checklists().
+            location (str): The location name to import the checklists under.
+            latitude (str): The station's latitude.
+            longitude (str): The station's longitude.
+            state (str): The location's state/province code (e.g., 'NC').
+            country (str): The location's country code (e.g., 'US').
+
+        Yields:
+            list: The 19 fields of each row.
+        """
+        import math
+
+        for ckl in checklists:
+            duration = math.ceil((ckl['stop'] - ckl['start']).total_seconds() / 60)
+            protocol = self.EBIRD_PROTOCOLS.get(ckl['protocol'], 'Stationary')
+            comments = f"{ckl['protocol']} acoustic detections, {ckl['start']} - {ckl['stop']}"
+
+            for (common_name, species_code), count in sorted(ckl['species'].items(), key=lambda d: f"{d[0][0]} ({d[0][1]})"):
+                yield [
+                    common_name, '', '', count, '',
+                    location, latitude, longitude,
+                    ckl['start'].strftime('%m/%d/%Y'), ckl['start'].strftime('%H:%M'),
+                    state, country, protocol, 1, duration, 'N', '', '',
+                    comments
+                ]
+
 class TalonConfigError(Exception):
     """A custom exception for specific errors in MyClass."""
     pass
@@ -153,6 +298,8 @@ class TalonConfig:
         self._load_config()
 
     def _load_config(self):
+        import configparser
+
         if os.path.exists(self.config_path):
             try:
                 self.config = configparser.ConfigParser(interpolation=None)
@@ -163,6 +310,287 @@ class TalonConfig:
                 print(f"Error parsing config, invalid value specified for: {e}")
                 sys.exit(1)
 
+            # persist sun times between runs, relative paths are relative to the config
+            if 'general' in self.config and 'ephemeris_dir' in self.config['general']:
+                cachedir = os.path.expanduser(self.config['general']['ephemeris_dir'])
+                TalonEphemeris.shared(os.path.join(os.path.dirname(os.path.abspath(self.config_path)), cachedir))
+
+class TalonStationResolver:
+    """
+    Match WAV file names to the station whose file_format they follow. Each
+    format is compiled once into a regex, and stations are bucketed by the
+    literal text their format starts with (e.g., 'RPI1_'), so a name is only
+    checked against the stations it could belong to and only parsed by
+    strptime once it's known to match.
+    """
+    # a permissive pattern for each strptime directive, strptime has the final say
+    DIRECTIVES = {
+        'Y': r'\d{4}', 'y': r'\d{1,2}', 'm': r'\d{1,2}', 'd': r'\s?\d{1,2}', 'H': r'\d{1,2}',
+        'I': r'\d{1,2}', 'M': r'\d{1,2}', 'S': r'\d{1,2}', 'f': r'\d{1,6}', 'j': r'\d{1,3}',
+        'z': r'(?:Z|[+-]\d\d:?\d\d(?::?\d\d(?:\.\d{1,6})?)?)', '%': '%'
+    }
+
+    def __init__(self, config):
+        self._buckets = {}
+
+        for order, section in enumerate(config):
+            if 'type' in config[section] and config[section]['type'] == 'station' and 'file_format' in config[section]:
+                prefix, regex = self.compile(config[section]['file_format'])
+                self._buckets.setdefault(prefix.lower(), []).append((order, regex, section, config[section]['file_format']))
+
+        # every length of prefix a name could start with is looked up, config
+        # order decides between stations whose formats both match
+        self._lengths = sorted({len(prefix) for prefix in self._buckets})
+
+    @classmethod
+    def compile(cls, file_format):
+        """
+        Return the literal prefix of a strptime format and a regex that matches
+        (at least) every string the format can parse.
+        """
+        import re
+
+        pattern = ''
+        prefix = None
+        i = 0
+
+        while i < len(file_format):
+            char = file_format[i]
+
+            if char == '%' and i + 1 < len(file_format):
+                directive = file_format[i + 1]
+
+                if prefix is None and directive != '%':
+                    prefix = file_format[:i]
+
+                pattern += cls.DIRECTIVES.get(directive, r'.+?')
+                i += 2
+            elif char.isspace():
+                # like strptime, any run of whitespace matches any other
+                pattern += r'\s+'
+                i += 1
+
+                while i < len(file_format) and file_format[i].isspace():
+                    i += 1
+            else:
+                pattern += re.escape(char)
+                i += 1
+
+        if prefix is None:
+            prefix = file_format
+
+        # strptime ignores case, so a .WAV format matches .wav names
+        return prefix.replace('%%', '%'), re.compile(pattern, re.IGNORECASE)
+
+    def resolve(self, filename):
+        """
+        Return (section, start) for the first station, in config order, whose
+        file_format parses the file's name, start is the datetime strptime
+        returns. Returns None if no station matches.
+        """
+        name = os.path.basename(str(filename))
+        key = name.lower()
+        candidates = []
+
+        for length in self._lengths:
+            candidates += self._buckets.get(key[:length], [])
+
+        for order, regex, section, file_format in sorted(candidates, key=lambda d: d[0]):
+            if regex.fullmatch(name):
+                try:
+                    return section, dt.strptime(name, file_format)
+                except ValueError:
+                    pass
+
+        return None
+
+class TalonTaxonomy:
+    """
+    eBird species codes and common names, combined with the Nighthawk group code
+    cross reference so group codes render as standard eBird 'spuhs'. Lookups
+    work like the code -> common name dict the tools used to build, with reverse
+    and prefix lookups for the override dialogs.
+
+    The combined table is saved as JSON beside the eBird taxonomy and reused until
+    either CSV changes, which loads several times faster than parsing ~18k rows.
+    Tables are also shared within a process, so reloading a folder is free.
+    """
+    CACHE_NAME = '.talon_taxonomy.json'
+    CACHE_VERSION = 1
+
+    _loaded = {}
+    _loaded_lock = threading.Lock()
+
+    def __init__(self, names=None, digest=None):
+        self._names = dict(names or {})
+        self._codes = None
+        self._completions = None
+
+        if digest is None:
+            import hashlib
+
+            digest = hashlib.sha1(json.dumps(list(self._names.items())).encode()).hexdigest()
+
+        self.digest = digest
+
+    @classmethod
+    def from_config(cls, config, talon_dir, debug=False):
+        """
+        Load the taxonomy named in the config's taxonomy section, relative paths
+        are relative to talon_dir. Missing files are skipped, as they always were.
+        """
+        paths = []
+
+        for key in ('ebird_taxonomy', 'group_code_xref'):
+            path = None
+
+            if 'taxonomy' in config and key in config['taxonomy']:
+                path = os.path.join(talon_dir, config['taxonomy'][key])
+
+            paths.append(path if path and os.path.exists(path) else None)
+
+        return cls.load(*paths, debug=debug)
+
+    @classmethod
+    def load(cls, ebird_path=None, group_code_path=None, debug=False):
+        sources = [cls._source(ebird_path), cls._source(group_code_path)]
+        key = json.dumps(sources)
+
+        with cls._loaded_lock:
+            if key not in cls._loaded:
+                # only the most recent table is kept, tools only ever use one
+                cls._loaded = { key: cls._load(ebird_path, group_code_path, sources, debug) }
+
+            return cls._loaded[key]
+
+    @staticmethod
+    def _source(path):
+        if path is None:
+            return None
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+    @classmethod
+    def _load(cls, ebird_path, group_code_path, sources, debug=False):
+        if not ebird_path and not group_code_path:
+            return cls()
+
+        cache_path = os.path.join(os.path.dirname(os.path.abspath(ebird_path or group_code_path)), cls.CACHE_NAME)
+
+        try:
+            with open(cache_path, 'r') as f:
+                data = json.load(f)
+
+            if data['version'] == cls.CACHE_VERSION and data['sources'] == sources:
+                return cls(zip(data['codes'], data['names']), data['digest'])
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            if debug:
+                print(f"Discarding taxonomy cache {cache_path}: {e}")
+
+        names = {}
+
+        if ebird_path:
+            with open(ebird_path, mode='r') as infile:
+                names.update((row[2], row[4]) for row in csv.reader(infile))
+
+        if group_code_path:
+            with open(group_code_path, mode='r') as infile:
+                names.update((row[0], row[1]) for row in csv.reader(infile))
+
+        taxonomy = cls(names)
+
+        import tempfile
+
+        try:
+            # talon's workers, tlist, and talon-gui can all rebuild the cache at
+            # once, so each writes its own temp file and swaps it in
+            fd, tmp = tempfile.mkstemp(prefix=cls.CACHE_NAME + '.', suffix='.tmp', dir=os.path.dirname(cache_path))
+
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({ 'version': cls.CACHE_VERSION, 'sources': sources, 'digest': taxonomy.digest, 'codes': list(names), 'names': list(names.values()) }, f)
+
+                os.replace(tmp, cache_path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        except OSError as e:
+            if debug:
+                print(f"Unable to save taxonomy cache {cache_path}: {e}")
+
+        return taxonomy
+
+    def __getitem__(self, code):
+        return self._names[code]
+
+    def __contains__(self, code):
+        return code in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getstate__(self):
+        # the lookup tables are rebuilt on demand
+        return { '_names': self._names, 'digest': self.digest }
+
+    def __setstate__(self, state):
+        self._names = state['_names']
+        self.digest = state['digest']
+        self._codes = None
+        self._completions = None
+
+    def get(self, code, default=None):
+        return self._names.get(code, default)
+
+    def keys(self):
+        return self._names.keys()
+
+    def values(self):
+        return self._names.values()
+
+    def items(self):
+        return self._names.items()
+
+    def code(self, common_name, default=None):
+        """Return the first species code with this common name, or default."""
+        if self._codes is None:
+            codes = {}
+
+            for code, name in self._names.items():
+                codes.setdefault(name, code)
+
+            self._codes = codes
+
+        return self._codes.get(common_name, default)
+
+    def complete(self, prefix, limit=None):
+        """Return the common names starting with prefix, ignoring case, in alphabetical order."""
+        import bisect
+
+        if self._completions is None:
+            self._completions = sorted({ (name.casefold(), name) for name in self._names.values() })
+
+        prefix = prefix.casefold()
+        matches = []
+
+        for folded, name in self._completions[bisect.bisect_left(self._completions, (prefix,)):]:
+            if not folded.startswith(prefix) or (limit is not None and len(matches) >= limit):
+                break
+
+            matches.append(name)
+
+        return matches
+
 class TalonGuanoFile:
     def __init__(self, wavfile, config, clear=False):
         self.config = config
@@ -194,6 +622,9 @@ class TalonGuanoFile:
             raise TalonFileNotFoundError(f"File not found: {self.wavfile}")
 
     def _load_guano(self):
+        import ephem
+        import guano
+
         self.old_gf = guano.GuanoFile(self.wavfile)
         self.gf = guano.GuanoFile(self.wavfile)
         keys = []
@@ -265,165 +696,1701 @@ class TalonGuanoFile:
         return output.strip()
 
 
-class TalonWAVFile:
-    def __init__(self, filename, section=None, taxonomy=None, clear=False, debug=False):
-        self.metadata = {}
-        self._filename = filename
-        self._section = section
-        self.metadata['section'] = {}
-        self.metadata['name'] = os.path.basename(self._filename)
-        self.metadata['events'] = []
+class TalonEphemeris:
+    """
+    Memoized sun times keyed by (latitude, longitude, timezone, date, depression).
+    A single astral sun() call provides dawn, sunrise, noon, sunset and dusk for
+    a date, so each key is only ever calculated once. The cache is safe to share
+    between threads and, when a cachedir is supplied, is persisted as one JSON
+    table per location and year.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
 
-        self._taxonomy = taxonomy
+    TIMES = ('dawn', 'sunrise', 'noon', 'sunset', 'dusk')
 
-        self._guano = None
+    # detections shortly after sunset, or before sunrise, are still treated
+    # as diurnal when classifying protocols
+    SUNSET_OFFSET = timedelta(minutes=20)
+    SUNRISE_OFFSET = timedelta(minutes=-40)
+
+    def __init__(self, cachedir=None, debug=False):
+        self._cachedir = cachedir
         self._debug = debug
+        self._lock = threading.RLock()
+        self._cache = {}
+        self._tables = set()
 
-        if self._section:
-            self._curtz = ZoneInfo(self._section['timezone'])
-            self._timestamp = dt.strptime(str(os.path.basename(self._filename)), self._section['file_format'])
-            self._timestamp.astimezone(self._curtz)
+    @classmethod
+    def shared(cls, cachedir=None):
+        """
+        Return the process wide ephemeris cache, creating it if necessary. The
+        first caller to supply a cachedir enables persistence.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(cachedir)
+            elif cachedir and not cls._shared._cachedir:
+                cls._shared._cachedir = cachedir
 
-            for key in section:
-                self.metadata['section'][key] = section[key]
+            return cls._shared
 
-        if os.path.exists(self._filename):
-            self.metadata['st_mtime'] = dt.fromtimestamp(os.stat(self._filename).st_mtime)
-            self._parse_chunks()
+    def __reduce__(self):
+        # the lock can't be pickled, and a worker process is better off using
+        # its own shared cache than a snapshot of ours
+        if self is TalonEphemeris._shared:
+            return (TalonEphemeris.shared, (self._cachedir,))
 
-    def GetEvents(self):
-        self._get_events()
+        return (TalonEphemeris, (self._cachedir, self._debug))
 
-    def SaveEvents(self):
-        self._save_ta_events()
+    def get(self, latitude, longitude, timezone, curdate, depression=18):
+        """
+        Returns:
+            dict: Timezone aware datetimes, with microseconds removed, for dawn,
+            sunrise, noon, sunset, and dusk. dawn/dusk use the supplied depression
+            (18 is astronomical twilight).
+        """
+        if isinstance(curdate, dt):
+            curdate = curdate.date()
 
-    def _get_chunk(self, fp):
-        chunk = []
-        chunk_offset = fp.tell()
-        data = fp.read(8)
+        key = (float(latitude), float(longitude), str(timezone), curdate, depression)
 
-        if len(data) == 8:
-            chunk_id = data[0:4].decode()
-            chunk_sz = chunk_sz_orig = int.from_bytes(data[4:8], byteorder='little')
+        with self._lock:
+            times = self._cache.get(key)
 
-            # adjust chunk size if chunk size is odd, as there should be a padding byte
-            if chunk_sz % 2 > 0:
-                chunk_sz += chunk_sz % 2
+            if times is None and self._cachedir:
+                self._load_table(key[0], key[1], key[2], curdate.year, depression)
+                times = self._cache.get(key)
 
-            chunk = [ chunk_id, chunk_sz, chunk_offset, chunk_sz_orig % 2 ]
+            if times is None:
+                times = self._compute(*key)
+                self._cache[key] = times
 
-        return chunk
+        return times
 
-    def _json_serializer(self, obj):
-        # keep datetimes natively in the dict, but auto convert them
-        # to iso formatted datetimes for printing or json dumping
-        if isinstance(obj, (dt)):
-            return obj.isoformat()
+    def classify(self, latitude, longitude, timezone, datetimes, depression=18):
+        """
+        Classify a batch of timezone aware datetimes as nfc, noc, or day. Each
+        datetime is compared against the sun times for its own date:
 
-        # any byte strings we get from the various chunks will be non-
-        # printable, so convert them to hex in a format similar to xxd
-        if isinstance(obj, (bytes)):
-            return obj.hex(' ', 2)
+            day: sunrise - 40m <= t < sunset + 20m
+            nfc: otherwise, and t >= astronomical dusk or t < astronomical dawn
+            noc: everything else
 
-        raise TypeError ("Type %s not serializable" % type(obj))
+        Returns:
+            ndarray: 'nfc', 'noc', or 'day' for each datetime.
+        """
+        import numpy as np
+
+        count = len(datetimes)
+
+        if count == 0:
+            return np.empty(0, dtype='<U3')
+
+        # integer microseconds since the epoch keep every comparison exact
+        epoch = dt(1970, 1, 1, tzinfo=ZoneInfo('UTC'))
+        usec = timedelta(microseconds=1)
+
+        stamps = np.fromiter(((d - epoch) // usec for d in datetimes), dtype=np.int64, count=count)
+        ordinals = np.fromiter((d.toordinal() for d in datetimes), dtype=np.int64, count=count)
+
+        # sun times are only looked up once per distinct date, then gathered
+        # back out to every datetime falling on that date
+        days, inverse = np.unique(ordinals, return_inverse=True)
+        bounds = np.empty((len(days), 4), dtype=np.int64)
+
+        for i, day in enumerate(days):
+            times = self.get(latitude, longitude, timezone, date.fromordinal(int(day)), depression)
+            bounds[i, 0] = (times['sunset'] + self.SUNSET_OFFSET - epoch) // usec
+            bounds[i, 1] = (times['sunrise'] + self.SUNRISE_OFFSET - epoch) // usec
+            bounds[i, 2] = (times['dusk'] - epoch) // usec
+            bounds[i, 3] = (times['dawn'] - epoch) // usec
+
+        sunset, sunrise, dusk, dawn = bounds[inverse.reshape(-1)].T
+
+        night = (stamps >= sunset) | (stamps < sunrise)
+        dark = (stamps >= dusk) | (stamps < dawn)
+
+        return np.where(night, np.where(dark, 'nfc', 'noc'), 'day')
+
+    def _compute(self, latitude, longitude, timezone, curdate, depression):
+        from astral import LocationInfo
+        from astral.sun import sun
+
+        location = LocationInfo(name='', region='', timezone=timezone, latitude=latitude, longitude=longitude)
+        times = sun(location.observer, date=curdate, dawn_dusk_depression=depression, tzinfo=ZoneInfo(timezone))
+
+        return { name: times[name].replace(microsecond=0) for name in self.TIMES }
+
+    def _table_path(self, latitude, longitude, timezone, year, depression):
+        return os.path.join(self._cachedir, f"E_{latitude:.6f}_{longitude:.6f}_{timezone.replace('/', '-')}_{year}_{depression}.json")
+
+    def _load_table(self, latitude, longitude, timezone, year, depression):
+        table = (latitude, longitude, timezone, year, depression)
+
+        if table in self._tables:
+            return
+
+        self._tables.add(table)
+        path = self._table_path(*table)
+        curtz = ZoneInfo(timezone)
 
-    def _parse_chunks(self):
         try:
-            with open(self._filename, 'rb') as f:
-                # this is the order in which chunks were found, so we can 
-                # reconstruct the file in the correct order
-                order = 0
-                self.metadata['st_size'] = 0
-                self.metadata['duration'] = 0
-                self.metadata['chunks'] = {}
-                riff_id, riff_sz, chunk_offset, padding = self._get_chunk(f)
+            with open(path, 'r') as f:
+                data = json.load(f)
 
-                if riff_id == 'RIFF':
-                    riff = {}
-                    riff['name'] = riff_id
-                    riff['size'] = riff_sz
-                    riff['offset'] = 0
-                    riff['wavid'] = f.read(4).decode()
-                    riff['order'] = order
+            for curdate in data:
+                key = (latitude, longitude, timezone, date.fromisoformat(curdate), depression)
+                self._cache[key] = { name: dt.fromisoformat(data[curdate][name]).astimezone(curtz) for name in self.TIMES }
 
-                    self.metadata['chunks']['riff'] = riff
-                    self.metadata['st_size'] = os.stat(self._filename).st_size
+            return
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, OSError) as e:
+            if self._debug:
+                print(f"Discarding ephemeris table {path}: {e}")
 
-                    if riff['wavid'] == 'WAVE':
-                        while True:
-                            order += 1
-                            offset = f.tell()
+        # a whole year is only ~365 sun() calls, so calculate it once and
+        # save it for next time
+        data = {}
+        curdate = date(year, 1, 1)
 
-                            if offset >= self.metadata['st_size']:
-                                break
+        while curdate.year == year:
+            key = (latitude, longitude, timezone, curdate, depression)
 
-                            chunk_id, chunk_sz, chunk_offset, padding = self._get_chunk(f)
+            try:
+                if key not in self._cache:
+                    self._cache[key] = self._compute(*key)
+
+                data[curdate.isoformat()] = { name: self._cache[key][name].isoformat() for name in self.TIMES }
+            except ValueError:
+                # the sun never reaches the depression at high latitudes, leave
+                # those dates out so get() raises as it always has
+                pass
+
+            curdate += timedelta(days=1)
+
+        import tempfile
+
+        try:
+            os.makedirs(self._cachedir, exist_ok=True)
+
+            # every process building the same table writes its own temp file
+            # and swaps it in, so neither a concurrent reader nor another
+            # writer ever sees a partial table
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=self._cachedir)
+
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f)
+
+                os.replace(tmp, path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        except OSError as e:
+            if self._debug:
+                print(f"Unable to save ephemeris table {path}: {e}")
+
+class TalonIndexError(Exception):
+    """Raised when a WAV metadata index can't be opened or created."""
+    pass
+
+class TalonWAVIndex:
+    """
+    A persistent SQLite index of parsed WAV metadata, keyed on path, size and mtime.
+
+    Unchanged files are hydrated from the index instead of re-reading their chunks,
+    which matters when an archive of hourly recordings lives on a NAS. Paths are
+    stored relative to the directory containing the index so the archive can be
+    moved or mounted elsewhere without invalidating it.
+
+    The index also caches each file's merged and classified detections, keyed on
+    a signature of everything they were built from (see TalonWAVFile), so repeat
+    queries over the same nights don't re-parse the detection files.
+    """
+    SCHEMA_VERSION = 2
+    DEFAULT_NAME = '.talon_index.db'
+
+    def __init__(self, path, debug=False):
+        self._debug = debug
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._taxonomy = None
+
+        self.path = path
+        self._root = os.path.dirname(os.path.abspath(path))
+
+        try:
+            # the talon cli parses files in a thread pool, so the connection is
+            # shared between threads and guarded by self._lock instead
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._create_schema()
+        except sqlite3.Error as e:
+            raise TalonIndexError(f"Unable to open index {self.path}: {e}")
+
+    @staticmethod
+    def for_path(path, index_path=None, debug=False):
+        """
+        Open the index used when scanning path, or index_path if one is supplied.
+
+        Returns None, rather than raising, when the index can't be used (e.g., a
+        read-only archive) as the index is only ever an optimization.
+        """
+        if index_path is None:
+            if not os.path.isdir(path):
+                return None
+
+            index_path = os.path.join(path, TalonWAVIndex.DEFAULT_NAME)
+
+        try:
+            return TalonWAVIndex(index_path, debug=debug)
+        except TalonIndexError as e:
+            if debug:
+                print(e)
+
+        return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM wavfiles').fetchone()[0]
+
+    def _create_schema(self):
+        self._db.execute('CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)')
+        row = self._db.execute("SELECT value FROM info WHERE key = 'version'").fetchone()
+
+        # the layout of the stored metadata changed, throw it all away
+        if row is None or int(row[0]) != TalonWAVIndex.SCHEMA_VERSION:
+            self._db.execute('DROP TABLE IF EXISTS wavfiles')
+            self._db.execute('DROP TABLE IF EXISTS events')
+            self._db.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('version', ?)", (str(TalonWAVIndex.SCHEMA_VERSION),))
+
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS wavfiles ('
+            'path TEXT PRIMARY KEY, '
+            'st_size INTEGER NOT NULL, '
+            'st_mtime_ns INTEGER NOT NULL, '
+            'duration REAL, '
+            'chunks TEXT NOT NULL, '
+            'section TEXT)'
+        )
+        self._db.execute('CREATE TABLE IF NOT EXISTS events (path TEXT PRIMARY KEY, signature TEXT NOT NULL, events BLOB NOT NULL)')
+        self._db.commit()
+
+    def _key(self, filename):
+        try:
+            return os.path.relpath(os.path.abspath(filename), self._root)
+        except ValueError:
+            # windows can't express a path on another drive relative to the index
+            return os.path.abspath(filename)
+
+    @staticmethod
+    def _encode(obj):
+        # chunk tables contain raw bytes (e.g., ext_data and unknown chunks)
+        # which json can't represent, so tag them as hex strings
+        if isinstance(obj, (bytes)):
+            return { '__bytes__': obj.hex() }
+
+        raise TypeError ("Type %s not serializable" % type(obj))
+
+    @staticmethod
+    def _decode(obj):
+        if '__bytes__' in obj:
+            return bytes.fromhex(obj['__bytes__'])
+
+        return obj
+
+    def lookup(self, filename, stat=None):
+        """
+        Return the indexed metadata for filename, or None if the file isn't in the
+        index or has changed since it was indexed.
+        """
+        if stat is None:
+            stat = os.stat(filename)
+
+        try:
+            with self._lock:
+                row = self._db.execute('SELECT st_size, st_mtime_ns, duration, chunks, section FROM wavfiles WHERE path = ?', (self._key(filename),)).fetchone()
+        except sqlite3.Error as e:
+            # a busy or damaged index only costs us a re-parse
+            if self._debug:
+                print(f"Index lookup failed for {filename}: {e}")
+
+            return None
+
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            return None
+
+        return {
+            'st_size': row[0],
+            'duration': row[2],
+            'chunks': json.loads(row[3], object_hook=TalonWAVIndex._decode),
+            'section': json.loads(row[4]) if row[4] else {}
+        }
+
+    def store(self, filename, stat, metadata):
+        """
+        Add, or replace, the metadata for filename. Changes aren't written to disk
+        until commit() or close() is called.
+        """
+        chunks = json.dumps(metadata['chunks'], default=TalonWAVIndex._encode)
+        section = json.dumps(metadata['section']) if metadata.get('section') else None
+
+        try:
+            with self._lock:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO wavfiles (path, st_size, st_mtime_ns, duration, chunks, section) VALUES (?, ?, ?, ?, ?, ?)',
+                    (self._key(filename), stat.st_size, stat.st_mtime_ns, metadata['duration'], chunks, section)
+                )
+                self._dirty = True
+        except sqlite3.Error as e:
+            if self._debug:
+                print(f"Unable to index {filename}: {e}")
+
+    def lookup_events(self, filename, signature):
+        """
+        Return the cached detections for filename as a TalonEvents store, or None
+        if there aren't any or they were built from different inputs.
+        """
+        try:
+            with self._lock:
+                row = self._db.execute('SELECT signature, events FROM events WHERE path = ?', (self._key(filename),)).fetchone()
+        except sqlite3.Error as e:
+            if self._debug:
+                print(f"Detection cache lookup failed for {filename}: {e}")
+
+            return None
+
+        if row is None or row[0] != signature:
+            return None
+
+        try:
+            return TalonEvents.from_bytes(row[1])
+        except (ValueError, KeyError, OSError) as e:
+            # written by an incompatible version, it'll be replaced
+            if self._debug:
+                print(f"Unable to load cached detections for {filename}: {e}")
+
+        return None
+
+    def store_events(self, filename, signature, events):
+        """
+        Cache the detections for filename. Like store(), nothing is written to
+        disk until commit() or close() is called.
+        """
+        try:
+            blob = events.to_bytes()
+        except ValueError as e:
+            if self._debug:
+                print(f"Unable to cache detections for {filename}: {e}")
+
+            return
+
+        try:
+            with self._lock:
+                self._db.execute('INSERT OR REPLACE INTO events (path, signature, events) VALUES (?, ?, ?)', (self._key(filename), signature, blob))
+                self._dirty = True
+        except sqlite3.Error as e:
+            if self._debug:
+                print(f"Unable to cache detections for {filename}: {e}")
+
+    def taxonomy_signature(self, taxonomy):
+        """
+        Return a digest of the taxonomy, which renames species in the cached
+        detections. It's computed once per taxonomy object as every file shares
+        the same one.
+        """
+        if self._taxonomy is None or self._taxonomy[0] is not taxonomy:
+            if isinstance(taxonomy, TalonTaxonomy):
+                digest = taxonomy.digest
+            else:
+                import hashlib
+
+                items = sorted(taxonomy.items()) if hasattr(taxonomy, 'items') else sorted(taxonomy or [])
+                digest = hashlib.sha1(repr(items).encode()).hexdigest()
+
+            self._taxonomy = (taxonomy, digest)
+
+        return self._taxonomy[1]
+
+    def invalidate(self, filename=None):
+        """Remove filename from the index, or every file if filename is None."""
+        with self._lock:
+            if filename is None:
+                self._db.execute('DELETE FROM events')
+                cur = self._db.execute('DELETE FROM wavfiles')
+            else:
+                self._db.execute('DELETE FROM events WHERE path = ?', (self._key(filename),))
+                cur = self._db.execute('DELETE FROM wavfiles WHERE path = ?', (self._key(filename),))
+
+            self._db.commit()
+
+        return cur.rowcount
+
+    def prune(self):
+        """Remove entries for files which no longer exist, returning the number removed."""
+        with self._lock:
+            paths = [row[0] for row in self._db.execute('SELECT path FROM wavfiles')]
+
+        missing = [(p,) for p in paths if not os.path.exists(os.path.join(self._root, p))]
+
+        if missing:
+            with self._lock:
+                self._db.executemany('DELETE FROM events WHERE path = ?', missing)
+                self._db.executemany('DELETE FROM wavfiles WHERE path = ?', missing)
+                self._db.commit()
+
+        return len(missing)
+
+    def rebuild(self, filenames):
+        """Throw away the whole index and re-parse every file in filenames."""
+        self.invalidate()
+
+        for filename in filenames:
+            TalonWAVFile(str(filename), index=self)
+
+        self.commit()
+
+    def commit(self):
+        with self._lock:
+            if self._dirty:
+                try:
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    # another process may hold the lock (e.g., cron jobs overlapping),
+                    # the entries will simply be indexed again next time
+                    if self._debug:
+                        print(f"Unable to update index {self.path}: {e}")
+
+                    self._db.rollback()
+
+                self._dirty = False
+
+    def close(self):
+        self.commit()
+
+        with self._lock:
+            self._db.close()
+
+
+class TalonEvent:
+    """
+    A lightweight view of a single row in a TalonEvents store. It behaves like
+    the event dicts it replaces (event['dt'], event.get('uid'), 'uid' in event,
+    event['disposition'] = 'confirmed', etc) and writes straight through to
+    the store.
+    """
+    __slots__ = ('_events', '_row')
+
+    def __init__(self, events, row):
+        self._events = events
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._events._get(self._row, key)
+
+    def __setitem__(self, key, value):
+        self._events._set(self._row, key, value)
+
+    def __contains__(self, key):
+        return self._events._has(self._row, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, TalonEvent):
+            if other._events is self._events and other._row == self._row:
+                return True
+
+            other = other.to_dict()
+
+        if isinstance(other, dict):
+            return self.to_dict() == other
+
+        return NotImplemented
+
+    # mutable, like the dicts this replaces
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        # pickle as a plain dict, so handing a few events to a worker process
+        # doesn't drag the entire store along with them
+        return (dict, (self.to_dict(),))
+
+    def get(self, key, default=None):
+        try:
+            return self._events._get(self._row, key)
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._events._keys(self._row)
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        return { key: self[key] for key in self.keys() }
+
+class TalonEvents:
+    """
+    A columnar store for detections. Each field lives in a typed numpy column,
+    strings (species codes, common names, file names, etc) are interned, and
+    timestamps are kept as epoch microseconds along with their timezone. Rows
+    are exposed as TalonEvent views so code written against event dicts keeps
+    working, while filters can run against whole columns at once.
+    """
+    FLOATS = ('start', 'stop', 'probability', 'orig_start', 'orig_stop', 'orig_probability')
+    STRINGS = ('filename', 'engine', 'species_code', 'common_name', 'orig_engine', 'orig_species', 'orig_common_name', 'disposition', 'protocol', 'station')
+    FLAGS = ('overridden', 'curated')
+    INTS = ('uid',)
+
+    # same order as the event dicts built by the detection parsers
+    KEYS = ('filename', 'dt', 'start_rel', 'start', 'stop', 'engine', 'species_code', 'common_name', 'probability',
+            'orig_start', 'orig_stop', 'orig_engine', 'orig_species', 'orig_common_name', 'orig_probability',
+            'disposition', 'overridden', 'curated', 'protocol', 'station', 'uid')
+
+    _EPOCH = dt(1970, 1, 1, tzinfo=ZoneInfo('UTC'))
+    _USEC = timedelta(microseconds=1)
+
+    # strings and timezones are interned for the whole process, so codes
+    # mean the same thing in every store and can be copied between them
+    _strings = []
+    _string_codes = {}
+    _tzs = []
+    _tz_codes = {}
+    _intern_lock = threading.Lock()
+
+    def __init__(self, events=None, capacity=16):
+        self._len = 0
+        self._cols = {}
+        self._extra = {}
+        self._alloc(max(capacity, 16))
+
+        if events is not None:
+            self.extend(events)
+
+    def _alloc(self, capacity):
+        import numpy as np
+
+        old = self._cols
+        count = self._len
+        self._cols = {}
+
+        for key in self.FLOATS:
+            self._cols[key] = np.full(capacity, np.nan, dtype=np.float64)
+
+        for key in self.STRINGS:
+            self._cols[key] = np.full(capacity, -1, dtype=np.int32)
+
+        for key in self.FLAGS:
+            self._cols[key] = np.full(capacity, -1, dtype=np.int8)
+
+        for key in self.INTS:
+            self._cols[key] = np.full(capacity, -1, dtype=np.int64)
+
+        self._cols['dt'] = np.zeros(capacity, dtype=np.int64)
+        self._cols['tz'] = np.full(capacity, -1, dtype=np.int16)
+
+        for key in old:
+            self._cols[key][:count] = old[key][:count]
+
+    def _reserve(self, count):
+        capacity = len(self._cols['dt'])
+
+        if self._len + count > capacity:
+            self._alloc(max(capacity * 2, self._len + count))
+
+    @classmethod
+    def intern(cls, value):
+        code = cls._string_codes.get(value)
+
+        if code is None:
+            with cls._intern_lock:
+                code = cls._string_codes.get(value)
+
+                if code is None:
+                    code = len(cls._strings)
+                    cls._strings.append(value)
+                    cls._string_codes[value] = code
+
+        return code
+
+    @classmethod
+    def _intern_tz(cls, tz):
+        code = cls._tz_codes.get(tz)
+
+        if code is None:
+            with cls._intern_lock:
+                code = cls._tz_codes.get(tz)
+
+                if code is None:
+                    code = len(cls._tzs)
+                    cls._tzs.append(tz)
+                    cls._tz_codes[tz] = code
+
+        return code
+
+    @staticmethod
+    def format_start_rel(start):
+        mins, secs = divmod(float(start), 60)
+        hours, mins = divmod(mins, 60)
+
+        return f"{int(hours):02d}:{int(mins):02d}:{secs:05.2f}"
+
+    def _get(self, row, key):
+        cols = self._cols
+
+        if key == 'dt':
+            tz = cols['tz'][row]
+
+            if tz < 0:
+                raise KeyError(key)
+
+            value = self._EPOCH + timedelta(microseconds=int(cols['dt'][row]))
+            tz = self._tzs[tz]
+
+            return value.astimezone(tz) if tz is not None else value.replace(tzinfo=None)
+        elif key in cols:
+            value = cols[key][row]
+
+            if key in self.FLOATS:
+                if value != value:
+                    raise KeyError(key)
+
+                return float(value)
+
+            if value < 0:
+                raise KeyError(key)
+
+            if key in self.STRINGS:
+                return self._strings[value]
+            elif key in self.FLAGS:
+                return bool(value)
+
+            return int(value)
+        elif key == 'start_rel':
+            # formatted on demand unless something stored a different value
+            if row in self._extra and key in self._extra[row]:
+                return self._extra[row][key]
+
+            return self.format_start_rel(self._get(row, 'start'))
+
+        try:
+            return self._extra[row][key]
+        except KeyError:
+            raise KeyError(key)
+
+    def _set(self, row, key, value):
+        cols = self._cols
+
+        if key == 'dt':
+            if value.tzinfo is None:
+                cols['dt'][row] = (value.replace(tzinfo=self._EPOCH.tzinfo) - self._EPOCH) // self._USEC
+            else:
+                cols['dt'][row] = (value - self._EPOCH) // self._USEC
+
+            cols['tz'][row] = self._intern_tz(value.tzinfo)
+        elif key in self.FLOATS:
+            cols[key][row] = value
+        elif key in self.STRINGS:
+            cols[key][row] = self.intern(value)
+        elif key in self.FLAGS:
+            cols[key][row] = bool(value)
+        elif key in self.INTS:
+            cols[key][row] = value
+        elif key == 'start_rel':
+            extra = self._extra.get(row)
+
+            if cols['start'][row] == cols['start'][row] and value == self.format_start_rel(cols['start'][row]):
+                if extra and key in extra:
+                    del extra[key]
+            else:
+                self._extra.setdefault(row, {})[key] = value
+        else:
+            self._extra.setdefault(row, {})[key] = value
+
+    def _has(self, row, key):
+        try:
+            self._get(row, key)
+            return True
+        except KeyError:
+            return False
+
+    def _keys(self, row):
+        keys = [key for key in self.KEYS if self._has(row, key)]
+
+        if row in self._extra:
+            keys += [key for key in self._extra[row] if key not in keys]
+
+        return keys
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for row in range(self._len):
+            yield TalonEvent(self, row)
+
+    def __repr__(self):
+        return f"TalonEvents({self._len} events)"
+
+    def __getitem__(self, index):
+        """
+        An int returns a TalonEvent view, a slice, boolean mask, or array of
+        row numbers returns a new TalonEvents holding a copy of those rows.
+        """
+        import numpy as np
+
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += self._len
+
+            if not 0 <= index < self._len:
+                raise IndexError('event index out of range')
+
+            return TalonEvent(self, int(index))
+
+        if isinstance(index, slice):
+            index = np.arange(self._len)[index]
+
+        return self.take(index)
+
+    def __iadd__(self, other):
+        self.extend(other)
+
+        return self
+
+    def __getstate__(self):
+        # codes are only meaningful within a process, so pickle the strings
+        # and timezones this store uses and re-intern them when unpickled
+        import numpy as np
+
+        cols = { key: self._cols[key][:self._len].copy() for key in self._cols }
+        codes = np.unique(np.concatenate([cols[key] for key in self.STRINGS]))
+        codes = codes[codes >= 0]
+        tzs = np.unique(cols['tz'])
+        tzs = tzs[tzs >= 0]
+
+        return {
+            'len': self._len,
+            'cols': cols,
+            'extra': self._extra,
+            'strings': (codes, [self._strings[c] for c in codes]),
+            'tzs': (tzs, [self._tzs[c] for c in tzs]),
+        }
+
+    def __setstate__(self, state):
+        import numpy as np
+
+        self._len = 0
+        self._cols = {}
+        self._extra = state['extra']
+        self._alloc(max(state['len'], 16))
+        self._len = state['len']
+
+        for key, (codes, values, intern) in { 'strings': state['strings'] + (self.intern,), 'tzs': state['tzs'] + (self._intern_tz,) }.items():
+            # the extra trailing slot maps missing values (-1) to -1
+            codes = np.asarray(codes, dtype=np.int64)
+            remap = np.full((int(codes.max()) if len(codes) else 0) + 2, -1, dtype=np.int64)
+            remap[codes] = [intern(v) for v in values]
+
+            for col in (self.STRINGS if key == 'strings' else ('tz',)):
+                self._cols[col][:self._len] = remap[state['cols'][col]]
+
+        for key in state['cols']:
+            if key not in self.STRINGS and key != 'tz':
+                self._cols[key][:self._len] = state['cols'][key]
+
+    @staticmethod
+    def _tz_name(tz):
+        if tz is None:
+            return None
+        elif isinstance(tz, ZoneInfo) and tz.key:
+            return tz.key
+        elif isinstance(tz, timezone):
+            return [tz.utcoffset(None) // TalonEvents._USEC, tz.tzname(None)]
+
+        raise ValueError(f"Unable to serialize timezone {tz!r}")
+
+    @staticmethod
+    def _tz_from_name(name):
+        if name is None:
+            return None
+        elif isinstance(name, str):
+            return ZoneInfo(name)
+
+        return timezone(timedelta(microseconds=name[0]), name[1])
+
+    def to_bytes(self):
+        """
+        Serialize the store as an npz archive, without pickle, for the detection
+        cache. Raises ValueError if it holds something which can't be represented.
+        """
+        import io
+        import numpy as np
+
+        state = self.__getstate__()
+        arrays = { f"col_{key}": value for key, value in state['cols'].items() }
+        arrays['string_codes'] = state['strings'][0]
+        arrays['tz_codes'] = state['tzs'][0]
+
+        # the strings go in the json rather than a numpy string array, which
+        # would turn an interned None into 'None' and strip trailing nulls
+        try:
+            meta = json.dumps({
+                'len': state['len'],
+                'strings': state['strings'][1],
+                'tzs': [self._tz_name(tz) for tz in state['tzs'][1]],
+                'extra': state['extra'],
+            })
+        except TypeError as e:
+            raise ValueError(e)
+
+        arrays['meta'] = np.frombuffer(meta.encode(), dtype=np.uint8)
+
+        buf = io.BytesIO()
+        np.savez_compressed(buf, allow_pickle=False, **arrays)
+
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a store serialized by to_bytes()."""
+        import io
+        import numpy as np
+
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            meta = json.loads(npz['meta'].tobytes())
+            state = {
+                'len': meta['len'],
+                'cols': { key[4:]: npz[key] for key in npz.files if key.startswith('col_') },
+                'extra': { int(row): values for row, values in meta['extra'].items() },
+                'strings': (npz['string_codes'], meta['strings']),
+                'tzs': (npz['tz_codes'], [cls._tz_from_name(name) for name in meta['tzs']]),
+            }
+
+        events = cls.__new__(cls)
+        events.__setstate__(state)
+
+        return events
+
+    def append(self, event):
+        """
+        Append an event (a dict or TalonEvent) and return a view of the new row.
+        """
+        self._reserve(1)
+        row = self._len
+        self._len += 1
+
+        # start is needed before start_rel to tell if start_rel is derived
+        if 'start' in event:
+            self._set(row, 'start', event['start'])
+
+        for key in event:
+            if key != 'start':
+                self._set(row, key, event[key])
+
+        return TalonEvent(self, row)
+
+    def extend(self, events):
+        if isinstance(events, TalonEvents):
+            count = len(events)
+            self._reserve(count)
+
+            for key in self._cols:
+                self._cols[key][self._len:self._len + count] = events._cols[key][:count]
+
+            for row in events._extra:
+                self._extra[self._len + row] = dict(events._extra[row])
+
+            self._len += count
+        elif isinstance(events, list) and all(type(event) is dict for event in events):
+            self._extend_dicts(events)
+        else:
+            for event in events:
+                self.append(event)
+
+    def _extend_dicts(self, events):
+        # fill each column in one go, rather than each event a key at a time
+        import numpy as np
+        from operator import itemgetter
+
+        count = len(events)
+        self._reserve(count)
+        first, last = self._len, self._len + count
+        cols = self._cols
+
+        # the parsers produce events with identical keys, so most of the time
+        # every column can be pulled straight out of the dicts
+        shapes = { tuple(event) for event in events }
+        keys = list(dict.fromkeys(key for shape in shapes for key in shape))
+
+        for key in keys:
+            if len(shapes) == 1:
+                rows = slice(first, last)
+                values = list(map(itemgetter(key), events))
+            else:
+                rows = np.flatnonzero([key in event for event in events]) + first
+                values = [event[key] for event in events if key in event]
+
+            if key in self.FLOATS or key in self.INTS:
+                cols[key][rows] = values
+            elif key in self.FLAGS:
+                cols[key][rows] = np.asarray(values, dtype=bool)
+            elif key in self.STRINGS:
+                for value in set(values):
+                    self.intern(value)
+
+                cols[key][rows] = list(map(self._string_codes.__getitem__, values))
+            elif key == 'dt':
+                tzs = { value.tzinfo: None for value in values }
+
+                for tz in tzs:
+                    tzs[tz] = self._intern_tz(tz)
+
+                naive = self._EPOCH.tzinfo
+                cols['dt'][rows] = [((value if value.tzinfo else value.replace(tzinfo=naive)) - self._EPOCH) // self._USEC for value in values]
+                cols['tz'][rows] = [tzs[value.tzinfo] for value in values]
+
+        self._len = last
+
+        # anything else, including start_rel values which differ from the
+        # start time they'd otherwise be derived from, is kept per row
+        for key in keys:
+            if key in cols:
+                continue
+
+            for row, event in enumerate(events, first):
+                if key in event:
+                    if key == 'start_rel' and 'start' in event:
+                        if event[key] == self.format_start_rel(event['start']):
+                            continue
+
+                    self._extra.setdefault(row, {})[key] = event[key]
+
+    def take(self, rows):
+        """
+        Return a new TalonEvents containing a copy of the supplied rows (a boolean
+        mask or an array of row numbers), in the order given.
+        """
+        import numpy as np
+
+        rows = np.asarray(rows)
+
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows[:self._len])
+
+        result = TalonEvents(capacity=len(rows))
+        result._len = len(rows)
+
+        for key in self._cols:
+            result._cols[key][:len(rows)] = self._cols[key][:self._len][rows]
+
+        if self._extra:
+            for new, old in enumerate(rows.tolist()):
+                if old in self._extra:
+                    result._extra[new] = dict(self._extra[old])
+
+        return result
+
+    def column(self, key):
+        """
+        Return a column as a numpy array (a view, don't hold on to it across
+        appends). Strings are returned as their interned codes, 'dt' as epoch
+        microseconds.
+        """
+        return self._cols[key][:self._len]
+
+    def mask(self, value=True):
+        import numpy as np
+
+        return np.full(self._len, value, dtype=bool)
+
+    def isin(self, key, values):
+        """
+        Boolean mask of rows whose value for key is in values.
+        """
+        import numpy as np
+
+        if isinstance(values, str):
+            values = [values]
+
+        if key in self.STRINGS:
+            values = [self._string_codes[v] for v in values if v in self._string_codes]
+
+        return np.isin(self.column(key), list(values))
+
+    def match(self, key, predicate):
+        """
+        Boolean mask of rows whose value for key satisfies predicate, which is
+        only called once per distinct value.
+        """
+        import numpy as np
+
+        codes, inverse = np.unique(self.column(key), return_inverse=True)
+        matched = [c >= 0 and bool(predicate(self._strings[c])) for c in codes.tolist()]
+
+        return np.asarray(matched, dtype=bool)[inverse.reshape(-1)]
+
+    def map(self, key, mapping, default=None):
+        """
+        Look up every row's string value for key in mapping, the lookup only
+        happens once per distinct value.
+        """
+        import numpy as np
+
+        codes, inverse = np.unique(self.column(key), return_inverse=True)
+        values = [mapping.get(self._strings[c], default) if c >= 0 else default for c in codes.tolist()]
+
+        return np.asarray(values)[inverse.reshape(-1)] if len(values) else np.asarray(values)
+
+    def epoch(self, value):
+        return (value - self._EPOCH) // self._USEC
+
+    def between(self, start, stop):
+        """
+        Boolean mask of rows with start <= dt <= stop.
+        """
+        column = self.column('dt')
+
+        return (column >= self.epoch(start)) & (column <= self.epoch(stop))
+
+    def sorted(self, key='dt'):
+        """
+        Return a new TalonEvents sorted by key (stable, like sorted()).
+        """
+        import numpy as np
+
+        column = self.column(key)
+
+        if key in self.STRINGS:
+            column = np.asarray([self._strings[c] if c >= 0 else '' for c in column.tolist()])
+
+        return self.take(np.argsort(column, kind='stable'))
+
+    def to_list(self):
+        return [event.to_dict() for event in self]
+
+    def json_records(self, chunk_size=4096):
+        """
+        Yield each row as a dict of JSON native values, with dt as an ISO 8601
+        string. The same dicts as to_dict() (less the datetimes), but built from
+        whole column slices a chunk at a time instead of looking up every key of
+        every row.
+        """
+        strings = self._strings
+        tzs = self._tzs
+
+        for first in range(0, self._len, chunk_size):
+            last = min(first + chunk_size, self._len)
+            cols = {key: self._cols[key][first:last] for key in self._cols}
+
+            values = {}
+            present = {}
+
+            for key in self.FLOATS:
+                values[key] = cols[key].tolist()
+                present[key] = (cols[key] == cols[key]).tolist()
+
+            for key in self.STRINGS + self.FLAGS + self.INTS:
+                values[key] = cols[key].tolist()
+                present[key] = (cols[key] >= 0).tolist()
+
+            for key in self.FLAGS:
+                values[key] = [value > 0 for value in values[key]]
+
+            stamps = cols['dt'].tolist()
+            zones = cols['tz'].tolist()
+
+            for offset in range(last - first):
+                row = first + offset
+                record = {}
+
+                for key in self.KEYS:
+                    if key == 'dt':
+                        if zones[offset] >= 0:
+                            value = self._EPOCH + timedelta(microseconds=stamps[offset])
+                            tz = tzs[zones[offset]]
+                            record[key] = (value.astimezone(tz) if tz is not None else value.replace(tzinfo=None)).isoformat()
+                    elif key == 'start_rel':
+                        if present['start'][offset]:
+                            record[key] = self.format_start_rel(values['start'][offset])
+                    elif present[key][offset]:
+                        value = values[key][offset]
+                        record[key] = strings[value] if key in self.STRINGS else value
+
+                if row in self._extra:
+                    record.update(self._extra[row])
+
+                yield record
+
+class TalonEventFilter:
+    """
+    Describes which detections to keep, so the parsers can drop rows as early
+    as possible. The engine, disposition and probability threshold are tested
+    against raw column values, species and filter.csv thresholds as soon as
+    the common name is known, and the time window before an event is built.
+    Criteria left as None match everything.
+    """
+    def __init__(self, threshold=None, species=None, engines=None, dispositions=None, protocols=None, stations=None, sfilter=None, start=None, stop=None):
+        self.threshold = threshold
+        self.species = species
+        self.engines = engines
+        self.dispositions = dispositions
+        self.protocols = protocols
+        self.stations = stations
+        self.sfilter = sfilter or {}
+        self.start = start
+        self.stop = stop
+
+    def wants_engine(self, engine, disposition='unconfirmed'):
+        return (self.engines is None or engine in self.engines) and (self.dispositions is None or disposition in self.dispositions)
+
+    def wants_station(self, station):
+        return self.stations is None or station in self.stations
+
+    def wants_probability(self, probability):
+        return self.threshold is None or probability >= self.threshold
+
+    def wants_name(self, common_name, probability):
+        if self.species is not None and common_name not in self.species:
+            return False
+
+        return common_name not in self.sfilter or probability > self.sfilter[common_name]
+
+    def wants_time(self, when):
+        return (self.start is None or when >= self.start) and (self.stop is None or when <= self.stop)
+
+    def seconds(self, timestamp, slop=0.001):
+        """
+        The time window in seconds relative to timestamp (the start of a WAV
+        file), padded by slop so it can be tested against a detection's start
+        offset before its datetime is calculated.
+        """
+        if not timestamp.tzinfo:
+            return None, None
+
+        second = timedelta(seconds=1)
+        start = (self.start - timestamp) / second - slop if self.start else None
+        stop = (self.stop - timestamp) / second + slop if self.stop else None
+
+        return start, stop
+
+    def mask(self, events):
+        """
+        Boolean mask of the rows in a TalonEvents store which pass the filter.
+        """
+        selected = events.mask()
+
+        if self.engines is not None:
+            selected &= events.isin('engine', self.engines)
+
+        if self.dispositions is not None:
+            selected &= events.isin('disposition', self.dispositions)
+
+        if self.protocols is not None:
+            selected &= events.isin('protocol', self.protocols)
+
+        if self.stations is not None:
+            selected &= events.isin('station', self.stations)
+
+        probability = events.column('probability')
+
+        if self.threshold is not None:
+            selected &= probability >= self.threshold
+
+        if self.species is not None:
+            selected &= events.match('common_name', lambda name: name in self.species)
+
+        if self.sfilter:
+            selected &= probability > events.map('common_name', self.sfilter, float('-inf')).astype(float)
+
+        if self.start is not None:
+            selected &= events.column('dt') >= events.epoch(self.start)
+
+        if self.stop is not None:
+            selected &= events.column('dt') <= events.epoch(self.stop)
+
+        return selected
+
+class TalonWAVFile:
+    def __init__(self, filename, section=None, taxonomy=None, clear=False, debug=False, index=None, ephemeris=None):
+        self.metadata = {}
+        self._filename = filename
+        self._section = section
+        self.metadata['section'] = {}
+        self.metadata['name'] = os.path.basename(self._filename)
+        self.metadata['events'] = []
+
+        self._taxonomy = taxonomy
+
+        self._guano = None
+        self._debug = debug
+        self._index = index
+        self._ephemeris = ephemeris if ephemeris is not None else TalonEphemeris.shared()
+
+        if self._section:
+            self._curtz = ZoneInfo(self._section['timezone'])
+            self._timestamp = dt.strptime(str(os.path.basename(self._filename)), self._section['file_format'])
+            self._timestamp.astimezone(self._curtz)
+
+            for key in section:
+                self.metadata['section'][key] = section[key]
+
+        try:
+            stat = os.stat(self._filename)
+        except FileNotFoundError:
+            stat = None
+
+        if stat is not None:
+            self.metadata['st_mtime'] = dt.fromtimestamp(stat.st_mtime)
+            row = None
+
+            if index is not None:
+                row = index.lookup(self._filename, stat)
+
+            if row is not None:
+                self._hydrate(row)
+            else:
+                self._parse_chunks()
+
+                # only index files we were able to parse completely
+                if index is not None and 'fmt' in self.metadata.get('chunks', {}) and 'data' in self.metadata['chunks']:
+                    index.store(self._filename, stat, self.metadata)
+
+    def __getstate__(self):
+        # the taxonomy is shared by every file and can be large, so it isn't
+        # pickled when files are handed between processes, nor is the index's
+        # database connection
+        state = self.__dict__.copy()
+        state['_taxonomy'] = {}
+        state['_index'] = None
+
+        return state
+
+    def _hydrate(self, row):
+        # populate metadata from an index row instead of opening the file
+        self.metadata['st_size'] = row['st_size']
+        self.metadata['duration'] = row['duration']
+        self.metadata['chunks'] = row['chunks']
+
+        if not self.metadata['section']:
+            self.metadata['section'] = row['section']
+
+    def GetEvents(self, filters=None):
+        self._get_events(filters=filters)
+
+    def SaveEvents(self):
+        self._save_ta_events()
+
+    def _get_chunk(self, fp):
+        chunk = []
+        chunk_offset = fp.tell()
+        data = fp.read(8)
+
+        if len(data) == 8:
+            chunk_id = data[0:4].decode()
+            chunk_sz = chunk_sz_orig = int.from_bytes(data[4:8], byteorder='little')
+
+            # adjust chunk size if chunk size is odd, as there should be a padding byte
+            if chunk_sz % 2 > 0:
+                chunk_sz += chunk_sz % 2
+
+            chunk = [ chunk_id, chunk_sz, chunk_offset, chunk_sz_orig % 2 ]
+
+        return chunk
+
+    def _json_serializer(self, obj):
+        # keep datetimes natively in the dict, but auto convert them
+        # to iso formatted datetimes for printing or json dumping
+        if isinstance(obj, (dt)):
+            return obj.isoformat()
+
+        # any byte strings we get from the various chunks will be non-
+        # printable, so convert them to hex in a format similar to xxd
+        if isinstance(obj, (bytes)):
+            return obj.hex(' ', 2)
+
+        if isinstance(obj, (TalonEvents)):
+            return list(obj.json_records())
+
+        if isinstance(obj, (TalonEvent)):
+            return obj.to_dict()
+
+        raise TypeError ("Type %s not serializable" % type(obj))
+
+    def _parse_chunks(self):
+        try:
+            with open(self._filename, 'rb') as f:
+                # this is the order in which chunks were found, so we can 
+                # reconstruct the file in the correct order
+                order = 0
+                self.metadata['st_size'] = 0
+                self.metadata['duration'] = 0
+                self.metadata['chunks'] = {}
+                riff_id, riff_sz, chunk_offset, padding = self._get_chunk(f)
+
+                if riff_id == 'RIFF':
+                    riff = {}
+                    riff['name'] = riff_id
+                    riff['size'] = riff_sz
+                    riff['offset'] = 0
+                    riff['wavid'] = f.read(4).decode()
+                    riff['order'] = order
+
+                    self.metadata['chunks']['riff'] = riff
+                    self.metadata['st_size'] = os.stat(self._filename).st_size
+
+                    if riff['wavid'] == 'WAVE':
+                        while True:
+                            order += 1
+                            offset = f.tell()
+
+                            if offset >= self.metadata['st_size']:
+                                break
+
+                            chunk_id, chunk_sz, chunk_offset, padding = self._get_chunk(f)
+
+                            if chunk_id and chunk_id != '\x00\x00\x00\x00':
+                                chunk = {}
+
+                                chunk['name'] = chunk_id
+                                chunk['offset'] = chunk_offset
+                                chunk['size'] = chunk_sz
+                                chunk['padding'] = padding
+                                chunk['order'] = order
+
+                                if chunk_id == 'fmt ':
+                                    data = f.read(chunk_sz)
+
+                                    # format 1 is PCM, format 3 is IEEE Float
+                                    chunk['format'] = int.from_bytes(data[0:2], byteorder='little')
+                                    chunk['channels'] = int.from_bytes(data[2:4], byteorder='little')
+                                    chunk['samples_sec'] = int.from_bytes(data[4:8], byteorder='little')
+                                    chunk['bytes_sec'] = int.from_bytes(data[8:12], byteorder='little')
+                                    chunk['block_size'] = int.from_bytes(data[12:14], byteorder='little')
+                                    chunk['bit_depth'] = int.from_bytes(data[14:16], byteorder='little')
+
+                                    ext_size = int.from_bytes(data[16:18], byteorder='little')
+                                    chunk['ext_size'] = ext_size
+                                    chunk['ext_data'] = data[18:18+ext_size] #.hex(' ', 2)
+                                elif chunk_id == 'guan':
+                                    data = f.read(chunk_sz)
+
+                                    chunk['data'] = TalonWAVFile.decode_guano(data)
+                                    chunk['offset'] = chunk_offset
+                                    chunk['size'] = chunk_sz
+                                elif chunk_id == 'data':
+                                    # don't need to read the entire data chunk into memory, just skip to the next chunk
+                                    f.seek(chunk_sz, 1)
+                                else:
+                                    chunk['data'] = f.read(chunk_sz)
+
+                                self.metadata['chunks'][chunk['name'].strip()] = chunk
+                            else:
+                                break
+
+                    self.metadata['duration'] = self.metadata['chunks']['data']['size'] / self.metadata['chunks']['fmt']['bytes_sec']
+                else:
+                    print('Not a WAV file.')
+        except FileNotFoundError:
+            print(f"Error: File '{self._filename}' not found.")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+
+    @property
+    def channels(self):
+        return self.metadata['chunks']['fmt']['channels']
+
+    @property
+    def rate(self):
+        return self.metadata['chunks']['fmt']['samples_sec']
+
+    @property
+    def bits(self):
+        return self.metadata['chunks']['fmt']['bit_depth']
+
+    @property
+    def duration(self):
+        return self.metadata['chunks']['data']['size'] / self.metadata['chunks']['fmt']['bytes_sec']
+
+    def ExtractChannel(self, channel=0, quiet=False, engine='mmap'):
+        # the original sample-at-a-time loop is kept around as the 'loop'
+        # engine so it can be benchmarked against, or used as a fallback
+        if engine == 'loop':
+            self._extract_channel(channel, quiet)
+        else:
+            self._extract_channels([channel], quiet)
+
+    def ExtractChannels(self, channels=None, quiet=False, engine='mmap'):
+        # the loop engine can only write one channel per pass
+        if engine == 'loop':
+            for channel in (range(self.channels) if channels is None else channels):
+                self._extract_channel(channel, quiet)
+        else:
+            self._extract_channels(channels, quiet)
+
+    def _pack_chunks(self, channels, data_size):
+        """
+        Build the chunks which surround the data chunk for a new WAV file.
+
+        Args:
+            channels (int): Number of channels the new file will contain.
+            data_size (int): Size, in bytes, of the new data chunk.
+
+        Returns:
+            tuple: (prefix, suffix) where prefix is everything up to and including
+            the data chunk header, and suffix is everything following the data.
+        """
+        fmt = self.metadata['chunks']['fmt']
+        bpc = int(fmt['bit_depth'] / 8)
+
+        prefix = b''
+        suffix = b''
+        after_data = False
+
+        # python >= 3.7 maintains insertion order for dicts, so we can
+        # rely on ['chunks'] being in the proper order as we loop through
+        for cur in self.metadata['chunks']:
+            chunk = self.metadata['chunks'][cur]
+            header = b''
+
+            if chunk['name'] == 'RIFF':
+                # size is patched in below once we know the total length
+                header += struct.pack('4s', chunk['name'].encode())
+                header += struct.pack('<L', 0)
+                header += struct.pack('4s', chunk['wavid'].encode())
+            elif chunk['name'] == 'fmt ':
+                body = b''
+                body += struct.pack('<H', chunk['format'])
+                body += struct.pack('<H', channels)
+                body += struct.pack('<L', chunk['samples_sec'])
+                body += struct.pack('<L', chunk['samples_sec'] * bpc * channels)
+                body += struct.pack('<H', bpc * channels)
+                body += struct.pack('<H', chunk['bit_depth'])
+
+                # cbSize is only present on non-PCM and extensible formats
+                if chunk['size'] > 16:
+                    body += struct.pack('<H', chunk['ext_size'])
+                    body += chunk['ext_data']
+
+                header += struct.pack('4s', chunk['name'].encode())
+                header += struct.pack('<L', len(body))
+                header += body
+            elif chunk['name'] == 'data':
+                header += struct.pack('4s', chunk['name'].encode())
+                header += struct.pack('<L', data_size)
+
+                prefix += header
+                after_data = True
+                continue
+            elif chunk['name'] == 'guan':
+                data = TalonWAVFile.encode_guano(chunk['data'])
+                header += struct.pack('4s', chunk['name'].encode())
+                header += struct.pack('<L', len(data))
+                header += data
+            else:
+                header += struct.pack('4s', chunk['name'].encode())
+                header += struct.pack('<L', chunk['size'])
+                header += chunk['data']
+
+            # chunks must start on an even byte boundary
+            if len(header) % 2:
+                header += b'\x00'
+
+            if after_data:
+                suffix += header
+            else:
+                prefix += header
+
+        if data_size % 2:
+            suffix = b'\x00' + suffix
+
+        # RIFF size is total size of the file minus the 4-byte chunk name (RIFF)
+        # and the 4 byte size.
+        riff_size = len(prefix) + data_size + len(suffix) - 8
+        prefix = prefix[:4] + struct.pack('<L', riff_size) + prefix[8:]
+
+        return prefix, suffix
+
+    def _data_view(self):
+        """
+        Memory map the data chunk as a (frames, channels, bytes per sample) array
+        of bytes. This works for any sample width, including packed 24-bit, without
+        reading the data chunk into memory.
+        """
+        import numpy as np
+
+        fmt = self.metadata['chunks']['fmt']
+        data = self.metadata['chunks']['data']
+        bpc = int(fmt['bit_depth'] / 8)
+        offset = data['offset'] + 8
+
+        # files which were terminated abruptly may report more data than
+        # was actually written, so never map past the end of the file
+        size = min(data['size'], self.metadata['st_size'] - offset)
+        frames = size // fmt['block_size']
+
+        if frames <= 0:
+            return np.zeros((0, fmt['channels'], bpc), dtype=np.uint8)
+
+        return np.memmap(self._filename, dtype=np.uint8, mode='r', offset=offset, shape=(frames, fmt['channels'], bpc))
+
+    def read_frames(self, start_sec=0, duration_sec=None, channel=None, dtype='float32'):
+        """
+        Read samples from the data chunk by time, without reading the rest of
+        the file. Samples come from a memory mapped view of the data chunk.
+
+        Args:
+            start_sec (float): Offset, in seconds, from the start of the recording.
+            duration_sec (float): Number of seconds to read (default: to the end of the file).
+            channel (int): Channel to read, or None for every channel.
+            dtype (str): 'float32' or 'float64' to scale samples to -1.0 to 1.0, or
+                None for the native sample type. Native 8, 16 and 32-bit samples are
+                returned as views of the mapped file (no copy), packed 24-bit samples
+                are widened to int32.
+
+        Returns:
+            ndarray: (frames,) when a channel is supplied, otherwise (frames, channels).
+        """
+        rate = self.rate
+        view = self._data_view()
+        frames = view.shape[0]
+
+        first = min(max(int(round(start_sec * rate, 0)), 0), frames)
+
+        if duration_sec is None:
+            last = frames
+        else:
+            last = min(first + int(round(duration_sec * rate, 0)), frames)
+
+        if channel is not None:
+            return self._decode_frames(view[first:last, channel:channel+1], dtype)[:, 0]
+
+        return self._decode_frames(view[first:last], dtype)
+
+    def read_event(self, event, clip_len=3, channel=None, dtype='float32'):
+        """
+        Read the samples an audio clip of the supplied event would contain.
+        """
+        start, length = self._clip_bounds(event, clip_len)
+
+        return self.read_frames(start, length, channel, dtype)
+
+    def _decode_frames(self, view, dtype='float32'):
+        """
+        Convert a slice of the view returned by _data_view into samples,
+        (frames, channels), see read_frames for the supported dtypes.
+        """
+        import numpy as np
+
+        fmt = self.metadata['chunks']['fmt']
+        frames, channels, bpc = view.shape
+
+        # format 3 is IEEE float, WAVE_FORMAT_EXTENSIBLE keeps the real format
+        # in the first two bytes of the sub-format GUID
+        is_float = fmt['format'] == 3 or (fmt['format'] == 0xFFFE and fmt['ext_data'][6:8] == b'\x03\x00')
+
+        if bpc == 3:
+            # widen packed 24-bit samples into the top of an int32, the
+            # arithmetic shift back down restores the sign
+            wide = np.zeros((frames, channels, 4), dtype=np.uint8)
+            wide[..., 1:] = view
+            native = wide.view('<i4')[..., 0] >> 8
+        elif is_float:
+            native = view.view('<f4' if bpc == 4 else '<f8')[..., 0]
+        elif bpc == 1:
+            native = view[..., 0]
+        else:
+            # the sample bytes are contiguous even when a channel is sliced
+            # out, so this is a view of the mapped file rather than a copy
+            native = view.view({2: '<i2', 4: '<i4'}[bpc])[..., 0]
+
+        if dtype is None:
+            return native
+
+        if is_float:
+            return native.astype(dtype)
+
+        if bpc == 1:
+            # 8-bit PCM is unsigned
+            return (native.astype(dtype) - 128) / 128
+
+        return native.astype(dtype) / (1 << (8 * bpc - 1))
+
+    def _extract_channels(self, channels=None, quiet=False):
+        if channels is None:
+            channels = list(range(self.channels))
+
+        dest_path, filename = os.path.split(self._filename)
+        filename, extension = os.path.splitext(filename)
+        outfiles = {}
 
-                            if chunk_id and chunk_id != '\x00\x00\x00\x00':
-                                chunk = {}
+        for channel in channels:
+            outfile = os.path.join(dest_path, str(filename) + f"-{channel}" + f"{extension}")
 
-                                chunk['name'] = chunk_id
-                                chunk['offset'] = chunk_offset
-                                chunk['size'] = chunk_sz
-                                chunk['padding'] = padding
-                                chunk['order'] = order
+            if os.path.exists(outfile):
+                print(f"Destination file exists, please remove and try again: {outfile}")
+            else:
+                outfiles[channel] = outfile
 
-                                if chunk_id == 'fmt ':
-                                    data = f.read(chunk_sz)
+        if not outfiles:
+            return
 
-                                    # format 1 is PCM, format 3 is IEEE Float
-                                    chunk['format'] = int.from_bytes(data[0:2], byteorder='little')
-                                    chunk['channels'] = int.from_bytes(data[2:4], byteorder='little')
-                                    chunk['samples_sec'] = int.from_bytes(data[4:8], byteorder='little')
-                                    chunk['bytes_sec'] = int.from_bytes(data[8:12], byteorder='little')
-                                    chunk['block_size'] = int.from_bytes(data[12:14], byteorder='little')
-                                    chunk['bit_depth'] = int.from_bytes(data[14:16], byteorder='little')
+        view = self._data_view()
+        frames, _, bpc = view.shape
+        prefix, suffix = self._pack_chunks(1, frames * bpc)
 
-                                    ext_size = int.from_bytes(data[16:18], byteorder='little')
-                                    chunk['ext_size'] = ext_size
-                                    chunk['ext_data'] = data[18:18+ext_size] #.hex(' ', 2)
-                                elif chunk_id == 'guan':
-                                    data = f.read(chunk_sz)
+        # 1M frames per block keeps memory use to a few MB per channel while
+        # still handing numpy enough data to make each copy worthwhile
+        BLOCK_FRAMES = 1 << 20
 
-                                    chunk['data'] = TalonWAVFile.decode_guano(data)
-                                    chunk['offset'] = chunk_offset
-                                    chunk['size'] = chunk_sz
-                                elif chunk_id == 'data':
-                                    # don't need to read the entire data chunk into memory, just skip to the next chunk
-                                    f.seek(chunk_sz, 1)
-                                else:
-                                    chunk['data'] = f.read(chunk_sz)
+        label = ', '.join(str(c) for c in outfiles)
+        handles = {}
 
-                                self.metadata['chunks'][chunk['name'].strip()] = chunk
-                            else:
-                                break
+        try:
+            for channel in outfiles:
+                handles[channel] = open(outfiles[channel], 'wb')
+                handles[channel].write(prefix)
 
-                    self.metadata['duration'] = self.metadata['chunks']['data']['size'] / self.metadata['chunks']['fmt']['bytes_sec']
-                else:
-                    print('Not a WAV file.')
-        except FileNotFoundError:
-            print(f"Error: File '{self._filename}' not found.")
-        except Exception as e:
-            print(f"An error occurred: {e}")
+            for start in range(0, frames, BLOCK_FRAMES):
+                if not quiet:
+                    print(f"Splitting channel {label} from {self._filename}: {(start / frames)*100:3.2f}%", end='\r', flush=True)
 
-    @property
-    def channels(self):
-        return self.metadata['chunks']['fmt']['channels']
+                # de-interleave a whole block at once, slicing a channel out of
+                # the block yields a strided view which tobytes() packs for us
+                block = view[start:start + BLOCK_FRAMES]
 
-    @property
-    def rate(self):
-        return self.metadata['chunks']['fmt']['rate']
+                for channel in handles:
+                    handles[channel].write(block[:, channel, :].tobytes())
 
-    @property
-    def bits(self):
-        return self.metadata['chunks']['fmt']['bit_depth']
+            for channel in handles:
+                handles[channel].write(suffix)
+        finally:
+            for channel in handles:
+                handles[channel].close()
 
-    @property
-    def duration(self):
-        return self.metadata['chunks']['data']['size'] / self.metadata['chunks']['fmt']['bytes_sec']
+            del view
 
-    def ExtractChannel(self, channel=0, quiet=False):
-        self._extract_channel(channel, quiet)
+        if not quiet:
+            print(f"Splitting channel {label} from {self._filename}: {100:3.2f}%")
 
     def _extract_channel(self, channel=0, quiet=False):
         dest_path, filename = os.path.split(self._filename)
@@ -599,160 +2566,259 @@ class TalonWAVFile:
 
         return tmp
 
-    def _get_events(self, force=False):
+    @staticmethod
+    def detection_files(wav_path):
+        """
+        Return the paths of a recording's Nighthawk, BirdNET, and talon detection
+        files, whether or not they exist.
+        """
         nh_ext = '_detections.csv'
         bn_ext ='.BirdNET.selection.table.txt'
         ta_ext = '_talon.csv'
 
-        dest_path, filename = os.path.split(self._filename)
+        dest_path, filename = os.path.split(wav_path)
         filename, extension = os.path.splitext(filename)
 
-        bn_file = os.path.join(dest_path, str(filename) + bn_ext)
         nh_file = os.path.join(dest_path, str(filename) + nh_ext)
+        bn_file = os.path.join(dest_path, str(filename) + bn_ext)
         ta_file = os.path.join(dest_path, str(filename) + ta_ext)
 
-        self._get_nh_events(nh_file)
-        self._get_bn_events(bn_file)
+        return nh_file, bn_file, ta_file
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        return [st.st_size, st.st_mtime_ns]
+
+    @classmethod
+    def source_signature(cls, wav_path):
+        """
+        The size and modification time of a recording and each of its detection
+        files (None for those that don't exist), so a caller can tell whether
+        anything it was read from has changed.
+        """
+        return [cls._stat(path) for path in (str(wav_path),) + cls.detection_files(str(wav_path))]
+
+    def _get_events(self, force=False, filters=None):
+        nh_file, bn_file, ta_file = self.detection_files(self._filename)
+
+        # the parsers work on a plain list, which is packed into a columnar
+        # TalonEvents store once the talon overrides have been applied
+        self.metadata['events'] = []
+
+        if filters and not filters.wants_station(self._section.name):
+            self.metadata['events'] = TalonEvents()
+            return
+
+        # with an index, every detection is parsed and cached so the next query
+        # can be answered from the cache whatever its filters are
+        signature = None
+        parse_filters = filters
+
+        if self._index is not None:
+            signature = self._events_signature(nh_file, bn_file, ta_file)
+            events = None if force else self._index.lookup_events(self._filename, signature)
+
+            if events is not None:
+                # the cache is keyed relative to the index, but the file may be
+                # reached by a different path than the one it was cached under
+                events.column('filename')[:] = TalonEvents.intern(str(self._filename))
+                self.metadata['events'] = events[filters.mask(events)] if filters else events
+                return
+
+            parse_filters = None
+
+        self._get_nh_events(nh_file, parse_filters)
+        self._get_bn_events(bn_file, parse_filters)
         self._get_ta_events(ta_file)
 
-        important_dates = {}
+        # astrodawn/astrodusk are calculated for the day of each event, which means
+        # we're comparing against a non-contiguous range of time (e.g., the end of
+        # last night or the beginning of tonight)
+        protocols = self._ephemeris.classify(self._section['latitude'], self._section['longitude'], self._section['timezone'], [event['dt'] for event in self.metadata['events']])
+
+        for event, protocol in zip(self.metadata['events'], protocols.tolist()):
+            event['protocol'] = protocol
+            event['station'] = self._section.name
+
+        events = TalonEvents(self.metadata['events']).sorted('dt')
+
+        if signature is not None:
+            self._index.store_events(self._filename, signature, events)
+
+        # the parsers have already dropped what they could, this catches the
+        # talon overrides and anything that depends on the protocol
+        if filters:
+            events = events[filters.mask(events)]
+
+        self.metadata['events'] = events
+
+    def _events_signature(self, nh_file, bn_file, ta_file):
+        # everything the merged and classified detections are built from, the
+        # station's name and file format place them, its location and timezone
+        # decide their protocols, and the taxonomy names the talon overrides
+        section = self._section
+
+        return json.dumps([
+            TalonWAVIndex.SCHEMA_VERSION,
+            self._stat(nh_file), self._stat(bn_file), self._stat(ta_file),
+            self._index.taxonomy_signature(self._taxonomy),
+            [section.name, section['latitude'], section['longitude'], section['timezone'], section['file_format']],
+        ])
+
+    def _get_nh_events(self, nh_file, filters=None):
+        self.metadata['events'].extend(self._iter_nh_events(nh_file, filters))
+
+    def _get_bn_events(self, bn_file, filters=None):
+        self.metadata['events'].extend(self._iter_bn_events(bn_file, filters))
+
+    def _read_detections(self, path, delimiter=','):
+        """
+        Yield the header as a {column name: index} dict, followed by each row as
+        a list padded to the width of the header.
+        """
+        with open(path) as f:
+            reader = csv.reader(f, skipinitialspace=True, delimiter=delimiter)
+            header = next(reader, [])
+            width = len(header)
+
+            yield { name: i for i, name in enumerate(header) }
+
+            for row in reader:
+                # skip blank lines and pad short rows, as csv.DictReader would
+                if row:
+                    if len(row) < width:
+                        row += [None] * (width - len(row))
+
+                    yield row
+
+    def _iter_detections(self, path, engine, columns, filters=None, delimiter=','):
+        """
+        Yield event dicts for a Nighthawk or BirdNET detection file. Rows which
+        filters rejects are dropped as soon as possible, the probability and
+        start offset are checked before any datetime, taxonomy or dict work.
+        columns maps start, stop, species_code, common_name (optional) and
+        probability to the file's column names.
+        """
+        if filters and not filters.wants_engine(engine):
+            return
+
+        lower, upper = filters.seconds(self._timestamp) if filters else (None, None)
+        rows = self._read_detections(path, delimiter)
+        header = next(rows)
+
+        if not header:
+            return
+
+        start_col = header[columns['start']]
+        stop_col = header[columns['stop']]
+        species_col = header[columns['species_code']]
+        name_col = header[columns['common_name']] if 'common_name' in columns else species_col
+        probability_col = header[columns['probability']]
 
-        for event in self.metadata['events']:
-            curdate = event['dt'].date()
-            eventtime = event['dt']
+        filename = str(self._filename)
 
-            if curdate not in important_dates:
-                important_dates[curdate] = {}
+        for row in rows:
+            try:
+                probability = float(row[probability_col])
+
+                if filters and not filters.wants_probability(probability):
+                    continue
+
+                start = float(row[start_col])
+
+                if (lower is not None and start < lower) or (upper is not None and start > upper):
+                    continue
 
-                location=LocationInfo(name='', region='', timezone=self._section['timezone'], latitude=self._section['latitude'], longitude=self._section['longitude'])
-                important_dates[curdate]['astrodawn'] = sun(location.observer, date=curdate, dawn_dusk_depression=18, tzinfo=self._curtz)['dawn'].replace(microsecond=0)
-                important_dates[curdate]['astrodusk'] = sun(location.observer, date=curdate, dawn_dusk_depression=18, tzinfo=self._curtz)['dusk'].replace(microsecond=0)
-                important_dates[curdate]['sunset'] = sun(location.observer, date=curdate, tzinfo=self._curtz)['sunset'].replace(microsecond=0) + timedelta(minutes=20)
-                important_dates[curdate]['sunrise'] = sun(location.observer, date=curdate, tzinfo=self._curtz)['sunrise'].replace(microsecond=0) - timedelta(minutes=40)
+                species_code = row[species_col]
 
-            # astrodawn/astrodusk are calculated for the day of each event, which means
-            # we're comparing against a non-contiguous range of time (e.g., the end of
-            # last night or the beginning of tonight)
-            if eventtime >= important_dates[curdate]['sunset'] or eventtime < important_dates[curdate]['sunrise']:
-                if eventtime >= important_dates[curdate]['astrodusk'] or eventtime < important_dates[curdate]['astrodawn']:
-                    event['protocol'] = "nfc"
+                if species_code in self._taxonomy:
+                    common_name = self._taxonomy[species_code]
                 else:
-                    event['protocol'] = "noc"
-            else:
-                event['protocol'] = "day"
+                    common_name = row[name_col]
 
-            event['station'] = self._section.name
+                if filters and not filters.wants_name(common_name, probability):
+                    continue
 
-        self.metadata['events'] = sorted(self.metadata['events'], key=lambda d: d['dt'])
+                abstime = self._timestamp + timedelta(seconds=start)
 
-    def _get_nh_events(self, nh_file):
-        if os.path.exists(nh_file):
-            with open(nh_file) as f:
-                for det in [{k: v for k, v in row.items()} for row in csv.DictReader(f, skipinitialspace=True)]:
-                    try:
-                        delta = timedelta(seconds=float(det['start_sec']))
-                        abstime = self._timestamp + delta
-
-                        if not abstime.tzinfo:
-                            abstime = abstime.astimezone(self._curtz)
-
-                        # add relative, to the wav file, start time
-                        mins, secs = divmod(float(det['start_sec']), 60)
-                        hours, mins = divmod(mins, 60)
-                        start_rel = f"{int(hours):02d}:{int(mins):02d}:{secs:05.2f}"
-
-                        if det['predicted_category'] in self._taxonomy:
-                            common_name = self._taxonomy[det['predicted_category']]
-                        else:
-                            common_name = det['predicted_category']
-
-                        self.metadata['events'].append(
-                            { 
-                                'filename': str(self._filename),
-                                'dt': abstime,
-                                'start_rel': start_rel,
-
-                                'start': float(det['start_sec']),
-                                'stop': float(det['end_sec']),
-                                'engine': 'nh',
-                                'species_code': det['predicted_category'],
-                                'common_name': common_name,
-                                'probability': float(det['prob']),
-
-                                'orig_start': float(det['start_sec']),
-                                'orig_stop': float(det['end_sec']),
-                                'orig_engine': 'nh',
-                                'orig_species': det['predicted_category'],
-                                'orig_common_name': common_name,
-                                'orig_probability': float(det['prob']),
-
-                                'disposition': 'unconfirmed',
-                                'overridden': False,
-                                'curated': False
-                            }
-                        )
+                if not abstime.tzinfo:
+                    abstime = abstime.astimezone(self._curtz)
+
+                if filters and not filters.wants_time(abstime):
+                    continue
+
+                stop = float(row[stop_col])
+
+                # start_rel is derived from start by TalonEvents
+                yield {
+                    'filename': filename,
+                    'dt': abstime,
+
+                    'start': start,
+                    'stop': stop,
+                    'engine': engine,
+                    'species_code': species_code,
+                    'common_name': common_name,
+                    'probability': probability,
+
+                    'orig_start': start,
+                    'orig_stop': stop,
+                    'orig_engine': engine,
+                    'orig_species': species_code,
+                    'orig_common_name': common_name,
+                    'orig_probability': probability,
+
+                    'disposition': 'unconfirmed',
+                    'overridden': False,
+                    'curated': False
+                }
+
+            except TypeError as e:
+                print(f"TypeError: {e}")
 
-                    except TypeError as e:
-                        print(f"TypeError: {e}")
+                if engine == 'bn':
+                    print(row)
+
+    def _iter_nh_events(self, nh_file, filters=None):
+        if os.path.exists(nh_file):
+            yield from self._iter_detections(nh_file, 'nh', {
+                'start': 'start_sec',
+                'stop': 'end_sec',
+                'species_code': 'predicted_category',
+                'probability': 'prob',
+            }, filters)
         else:
             if self._debug:
                 print(f"Unable to locate: {nh_file}")
 
-    def _get_bn_events(self, bn_file):
+    def _iter_bn_events(self, bn_file, filters=None):
         if os.path.exists(bn_file):
-            with open(bn_file) as f:
-                for det in [{k: v for k, v in row.items()} for row in csv.DictReader(f, skipinitialspace=True, delimiter='\t')]:
-                    try:
-                        delta = timedelta(seconds=float(det['Begin Time (s)']))
-                        abstime = self._timestamp + delta
-
-                        if not abstime.tzinfo:
-                            abstime = abstime.astimezone(self._curtz)
-
-                        # add relative, to the wav file, start time
-                        mins, secs = divmod(float(det['Begin Time (s)']), 60)
-                        hours, mins = divmod(mins, 60)
-                        start_rel = f"{int(hours):02d}:{int(mins):02d}:{secs:05.2f}"
-
-                        if det['Species Code'] in self._taxonomy:
-                            common_name = self._taxonomy[det['Species Code']]
-                        else:
-                            common_name = det['Common Name']
-
-                        self.metadata['events'].append(
-                            {
-                                'filename': str(self._filename),
-                                'dt': abstime,
-                                'start_rel': start_rel,
-
-                                'start': float(det['Begin Time (s)']),
-                                'stop': float(det['End Time (s)']),
-                                'engine': 'bn',
-                                'species_code': det['Species Code'],
-                                'common_name': common_name,
-                                'probability': float(det['Confidence']),
-                                
-                                'orig_start': float(det['Begin Time (s)']),
-                                'orig_stop': float(det['End Time (s)']),
-                                'orig_engine': 'bn',
-                                'orig_species': det['Species Code'],
-                                'orig_common_name': common_name,
-                                'orig_probability': float(det['Confidence']),
-
-                                'disposition': 'unconfirmed',
-                                'overridden': False,
-                                'curated': False
-                            }
-                        )
-
-                    except TypeError as e:
-                        print(f"TypeError: {e}")
-                        print(det)
+            yield from self._iter_detections(bn_file, 'bn', {
+                'start': 'Begin Time (s)',
+                'stop': 'End Time (s)',
+                'species_code': 'Species Code',
+                'common_name': 'Common Name',
+                'probability': 'Confidence',
+            }, filters, delimiter='\t')
 
     def _get_ta_events(self, ta_file):
         if os.path.exists(ta_file):
+            events = self.metadata['events']
             remove_list = []
 
+            # index every event by the fields a curation row uses to name the
+            # detection it overrides, curations are added as they're read so
+            # later rows can override earlier ones
+            matches = {}
+
+            for event in events:
+                matches.setdefault((event['start'], event['stop'], event['engine'], event['species_code']), []).append(event)
+
             try:
                 with open(ta_file) as f:
                     for det in [{k: v for k, v in row.items()} for row in csv.DictReader(f, skipinitialspace=True)]:
@@ -765,27 +2831,23 @@ class TalonWAVFile:
                                 abstime = abstime.astimezone(self._curtz)
 
                             # add relative, to the wav file, start time
-                            mins, secs = divmod(float(det['start']), 60)
-                            hours, mins = divmod(mins, 60)
-                            start_rel = f"{int(hours):02d}:{int(mins):02d}:{secs:05.2f}"
+                            start_rel = TalonEvents.format_start_rel(det['start'])
 
                             if det['species_code'] in self._taxonomy:
                                 common_name = self._taxonomy[det['species_code']]
                             else:
                                 common_name = det['common_name']
 
-                            # iterate all events and remove any that are overridden by the user
-                            for event in self.metadata['events']:
-                                if det_orig_start == event['start'] and det_orig_stop == event['stop'] and det['orig_engine'] == event['engine'] and det['orig_species'] == event['species_code']:
-                                    remove_list.append(event)
-                            
+                            # remove any events that are overridden by the user
+                            remove_list.extend(matches.get((det_orig_start, det_orig_stop, det['orig_engine'], det['orig_species']), ()))
+
                             if det['overridden'] == 'True':
                                 engine = 'ta'
                             elif det['orig_engine'] != '':
                                 engine = det['orig_engine']
 
                             cur = { 
-                                    'filename': det['filename'],
+                                    'filename': str(self._filename),
                                     'dt': abstime,
                                     'start_rel': start_rel,
 
@@ -808,15 +2870,42 @@ class TalonWAVFile:
                                     'curated': True
                             }
 
-                            self.metadata['events'].append(cur)
+                            matches.setdefault((cur['start'], cur['stop'], cur['engine'], cur['species_code']), []).append(cur)
+                            events.append(cur)
 
-                for item in remove_list:
-                    self.metadata['events'].remove(item)
+                if remove_list:
+                    self.metadata['events'] = self._remove_events(events, remove_list)
             except TypeError as e:
                 print(f"TypeError: {e}")
             except KeyError as e:
                 print(f"Error processing {ta_file}: {e}")
 
+    @staticmethod
+    def _remove_events(events, remove_list):
+        # equivalent to calling events.remove() for each item, which drops the
+        # first event equal to it, but in one pass, an item with no equal events
+        # left (e.g., a detection curated twice) is ignored instead of raising
+        counts = {}
+
+        for event in remove_list:
+            key = frozenset(event.items())
+            counts[key] = counts.get(key, 0) + 1
+
+        keys = { (event['start'], event['stop'], event['engine'], event['species_code']) for event in remove_list }
+        kept = []
+
+        for event in events:
+            if (event['start'], event['stop'], event['engine'], event['species_code']) in keys:
+                key = frozenset(event.items())
+
+                if counts.get(key):
+                    counts[key] -= 1
+                    continue
+
+            kept.append(event)
+
+        return kept
+
     def _save_ta_events(self):
         # TODO: when saving events, remove any unconfirmed which have an old_engine of nh/bn
         # also, don't add a new entry when updating a ta event, just overwrite that row
@@ -840,6 +2929,8 @@ class TalonWAVFile:
         #     writer.writerows(events)
 
     def _write_guano_data(self, write=False):
+        import ephem
+
         keys = []
 
         # delete all existing guano data
@@ -871,183 +2962,212 @@ class TalonWAVFile:
             if write:
                 pass
 
-    def extract_audio(self, event, clip_len, clipdir, full_height=False, graph=False, force=False, debug=False, silent=False):
+    def _clip_name(self, event, extension):
+        return f"{event['dt'].strftime('%Y%m%d-%H%M%S%z')}-{event['engine']}-{event['species_code']}.{extension}"
+
+    def _clip_bounds(self, event, clip_len):
+        """
+        Calculate the start time and length, in seconds, of the clip for an event.
+        """
         dur_sec = event['stop'] - event['start']
-        filename = f"{event['dt'].strftime('%Y%m%d-%H%M%S%z')}-{event['engine']}-{event['species_code']}.WAV"
-        outfile = os.path.join(clipdir, f"{filename}")
+        start = event['start']
+
+        if dur_sec > clip_len:
+            clip_len = dur_sec
+
+        # expand the audio clip from dur_sec to clip_len, ensuring
+        # the clip is centered in the new duration
+        if dur_sec < clip_len:
+            padding = dur_sec / 2
+
+            # clip occurs at the beginning of file, add padding to
+            # the end even though it means it won't be centered
+            if start < padding:
+                start = 0
+            # clip occurs at the end of the file, add padding to the
+            # beginning even though it means it won't be centered
+            elif (self.duration - event['stop']) < padding:
+                start = self.duration - clip_len
+            # clip occurs in the middle of the file somewhere, just
+            # try to center it.
+            else:
+                start = (start + (dur_sec / 2)) - (clip_len / 2)
 
-        if not os.path.exists(outfile):
-            if not os.path.exists(clipdir):
-                # race condition with multiprocessing where one 'thread' creates
-                # the dir after another one determines it doesn't exist so, we'll
-                # wrap it in a try/except and just pass on the error
-                try:
-                    os.mkdir(clipdir)
-                except FileExistsError:
-                    pass
+        return max(start, 0), clip_len
 
-            if not silent:
-                print(f"Extracting audio from {event['dt'].strftime('%Y-%m-%d-%H:%M:%S')} - {(event['dt']+timedelta(seconds=dur_sec)).strftime('%Y-%m-%d-%H:%M:%S')} to {filename}")
-
-            start = event['start']
-
-            if dur_sec > clip_len:
-                clip_len = dur_sec
-
-            # expand the audio clip from dur_sec to clip_len, ensuring
-            # the clip is centered in the new duration
-            if dur_sec < clip_len:
-                padding = dur_sec / 2
-
-                # clip occurs at the beginning of file, add padding to
-                # the end even though it means it won't be centered
-                if start < padding:
-                    start = 0
-                # clip occurs at the end of the file, add padding to the
-                # beginning even though it means it won't be centered
-                elif (self.duration - event['stop']) < padding:
-                    start = self.duration - clip_len
-                # clip occurs in the middle of the file somewhere, just
-                # try to center it.
-                else:
-                    start = (start + (dur_sec / 2)) - (clip_len / 2)
+    def extract_audio(self, event, clip_len, clipdir, full_height=False, graph=False, force=False, debug=False, silent=False, engine='matplotlib', annotate=True, clip=True):
+        self.extract_clips([event], clip_len, clipdir, full_height, graph, force, debug, silent, engine=engine, annotate=annotate, clip=clip)
 
-            secs_per_byte = 1 / self.metadata['chunks']['fmt']['bytes_sec']
-            clip_size  = int(round(clip_len/secs_per_byte, 0))
-            clip_start = self.metadata['chunks']['data']['offset'] + 8 + int(round(start/secs_per_byte, 0))
+    def extract_clips(self, events, clip_len, clipdir, full_height=False, graph=False, force=False, debug=False, silent=False, progress=None, engine='matplotlib', annotate=True, clip=True):
+        """
+        Extract audio clips, and optionally spectrographs, for a batch of events
+        from this file. The data chunk is mapped once and the header is built
+        once, only the sizes are patched for each clip. Spectrographs are
+        rendered straight from the mapped data, so they don't depend on the clip.
 
-            with open(self._filename, 'rb') as f:
-                f.seek(clip_start)
-                clip_data = f.read(clip_size)
+        Args:
+            events (list): Event dicts belonging to this file.
+            clip_len (int): Minimum length, in seconds, of each clip.
+            clipdir (str): Directory to write clips to.
+            progress (callable): Called with (done, total) after each event.
+            engine (str): Spectrograph engine, 'matplotlib' or 'fast'.
+            annotate (bool): Draw the title and axes (the fast engine can skip them).
+            clip (bool): Write the audio clip, set to False to render only spectrographs.
+
+        Returns:
+            list: Paths of the clips, whether they were written now or already existed.
+        """
+        fmt = self.metadata['chunks']['fmt']
+        rate = fmt['samples_sec']
+        block_size = fmt['block_size']
+
+        # sort by position in the file so the clips are read front to back
+        events = sorted(events, key=lambda e: e['start'])
+        outfiles = []
+        view = None
+
+        if not os.path.exists(clipdir):
+            # race condition with multiprocessing where one 'thread' creates
+            # the dir after another one determines it doesn't exist so, we'll
+            # wrap it in a try/except and just pass on the error
+            try:
+                os.mkdir(clipdir)
+            except FileExistsError:
+                pass
 
-            with open(outfile, 'wb') as o:
-                # python >= 3.7 maintains insertion order for dicts, so we can
-                # rely on ['chunks'] being in the proper order as we loop through
-                for cur in self.metadata['chunks']:
-                    chunk = self.metadata['chunks'][cur]
+        try:
+            for count, event in enumerate(events, 1):
+                filename = self._clip_name(event, 'WAV')
+                outfile = os.path.join(clipdir, filename)
+                write_clip = clip and not os.path.exists(outfile)
+                write_graph = graph and (force or not os.path.exists(os.path.join(clipdir, self._clip_name(event, 'PNG'))))
 
-                    # reinitialize header var for each chunk
-                    header = b''
+                if clip:
+                    outfiles.append(outfile)
 
-                    if chunk['name'] == 'RIFF':
-                        header += struct.pack('4s', chunk['name'].encode())
-                        header += struct.pack('<l', chunk['size'])
-                        header += struct.pack('4s', chunk['wavid'].encode())
+                if write_clip or write_graph:
+                    if view is None:
+                        view = self._data_view()
+                        frames = view.shape[0]
+                        prefix, suffix = self._pack_chunks(fmt['channels'], 0)
 
-                        o.write(header)
-                    elif chunk['name'] == 'fmt ':
-                        # TODO: calculate size based on the data we're packing
-                        header += struct.pack('4s', chunk['name'].encode())
-                        header += struct.pack('<l', chunk['size'])
-                        header += struct.pack('<H', chunk['format'])
-                        header += struct.pack('<H', chunk['channels'])
-                        header += struct.pack('<l', chunk['samples_sec'])
-                        header += struct.pack('<l', int(chunk['bytes_sec']/chunk['channels']))
-                        header += struct.pack('<H', int(chunk['block_size']/chunk['channels']))
-                        header += struct.pack('<H', chunk['bit_depth'])
+                    start, length = self._clip_bounds(event, clip_len)
 
-                        if chunk['ext_size'] > 0:
-                            header += struct.pack('<H', chunk['ext_size'])
-                            header += struct.pack(f"{len(chunk['ext_data'])}s", chunk['ext_data'])
+                    # work in whole frames so a clip never starts partway
+                    # through a sample
+                    first = min(int(round(start * rate, 0)), frames)
+                    last = min(first + int(round(length * rate, 0)), frames)
 
-                        o.write(header)
-                    elif chunk['name'] == 'data':
-                        # write data chunk name
-                        o.write(struct.pack('4s', chunk['name'].encode()))
+                if write_clip:
+                    dur_sec = event['stop'] - event['start']
 
-                        o.write(struct.pack('<l', clip_size))
-                        o.write(clip_data)
-                    elif chunk['name'] == 'guan':
-                        header += struct.pack('4s', chunk['name'].encode())
-                        data = TalonWAVFile.encode_guano(chunk['data'])
-                        size = len(data)
-                        header += struct.pack('<l', size)
-                        header += struct.pack(f"{len(data)}s", data)
+                    if not silent:
+                        print(f"Extracting audio from {event['dt'].strftime('%Y-%m-%d-%H:%M:%S')} - {(event['dt']+timedelta(seconds=dur_sec)).strftime('%Y-%m-%d-%H:%M:%S')} to {filename}")
 
-                        o.write(header)
-                    else:
-                        header += struct.pack('4s', chunk['name'].encode())
-                        header += struct.pack('<l', chunk['size'])
-                        header += struct.pack(f"{len(chunk['data'])}s", chunk['data'])
+                    clip_size = (last - first) * block_size
+                    pad = b'\x00' if clip_size % 2 else b''
+
+                    # only the RIFF and data sizes differ between clips
+                    riff_size = len(prefix) + clip_size + len(pad) + len(suffix) - 8
+                    header = prefix[:4] + struct.pack('<L', riff_size) + prefix[8:-4] + struct.pack('<L', clip_size)
 
+                    with open(outfile, 'wb') as o:
                         o.write(header)
-                
-                # RIFF size is total size of the file minus the 4-by chunk name (RIFF)
-                # and the 4 byte size.
-                riff_size = o.seek(0, 2) - 8
+                        o.write(view[first:last].tobytes())
+                        o.write(pad + suffix)
 
-                o.seek(4)
-                o.write(struct.pack('<l', riff_size))
+                if write_graph:
+                    self._generate_graph(event, self._decode_frames(view[first:last]), clipdir, full_height, force, debug, silent, engine, annotate)
 
-        if graph:
-            self._generate_graph(event, filename, clipdir, full_height, force, debug, silent)
+                if progress:
+                    progress(count, len(events))
+        finally:
+            del view
+
+        return outfiles
 
     def _spec_y_formatter(self, x, pos):
         'The two args are the value and tick position'
         return '%1.1fk' % (x/1000)
 
-    def _generate_graph(self, event, wavefile, clipdir, full_height=False, force=False, debug=False, silent=False):
+    def _generate_graph(self, event, samples, clipdir, full_height=False, force=False, debug=False, silent=False, engine='matplotlib', annotate=True):
         """
         Generate a spectrograph of the supplied event.
 
         Args:
             event (dict): An event dict which we'll use to generate the spectrograph.
+            samples (ndarray): Float samples of the clip, (frames, channels), at the file's native rate.
             clip_dir (str): Name of the directory to store graphs in (default: clips).
             title (str): The title of the graph.
             force (bool): Whether or not to overwrite the clip file if it already exists. 
+            engine (str): 'matplotlib' (librosa/pyplot) or 'fast' (numpy, see TalonSpectrogram).
+            annotate (bool): Draw the title and axes, only honoured by the fast engine.
         """
 
         dur_sec = event['stop'] - event['start']
-        filename = f"{event['dt'].strftime('%Y%m%d-%H%M%S%z')}-{event['engine']}-{event['species_code']}.PNG"
+        filename = self._clip_name(event, 'PNG')
         outpath = os.path.join(clipdir, f"{filename}")
 
         if not os.path.exists(outpath) or force:
             if not silent:
                 print(f"Generating graph from {event['dt'].strftime('%Y-%m-%d-%H:%M:%S')} - {(event['dt']+timedelta(seconds=dur_sec)).strftime('%Y-%m-%d-%H:%M:%S')} to {filename}")
 
-            # these libraries take nearly 1.0s to import, which makes the cli
-            # app seem very sluggish, so we'll only import them when necessary.
-            # no risk of duplicate imports as python should only return a
-            # reference to the first instance of an imported module.
-            import numpy as np
-            import librosa
-            import matplotlib
-            import matplotlib.pyplot as plt
-            from matplotlib.ticker import FormatStrFormatter as fsf
-
             height = 24000
 
             if full_height:
                 height=None
 
-            # Use high quality backend for rendering PNGs
-            matplotlib.use('agg')
-
             # ta means a user has overridden the entry, or added one manually.
             if event['engine'] == 'ta':
                 title = f"{event['common_name']}\n{event['dt'].strftime('%Y-%m-%d %H:%M:%S%z')}\n"
             else:
                 # setup full engine names for the title
                 if event['engine'] == 'bn':
-                    engine = 'BirdNet'
+                    engine_name = 'BirdNet'
                 else:
-                    engine = 'Nighthawk'
+                    engine_name = 'Nighthawk'
 
                 # newline at the end add a bit of extra space before the graph, makes the title look centered vertically
                 if event['overridden']:
                     # if the event is overridden then it's misleading to include engine/probability
                     title = f"{event['common_name']}\n{event['dt'].strftime('%Y-%m-%d %H:%M:%S%z')}\n"
                 else:
-                    title = f"{event['common_name']} ({engine} - {event['probability']*100:-5.2f}%)\n{event['dt'].strftime('%Y-%m-%d %H:%M:%S%z')}\n"
+                    title = f"{event['common_name']} ({engine_name} - {event['probability']*100:-5.2f}%)\n{event['dt'].strftime('%Y-%m-%d %H:%M:%S%z')}\n"
+
+            if engine == 'fast':
+                spec = TalonSpectrogram(samples, self.rate, max_freq=height/2 if height else None)
+
+                if annotate:
+                    spec.save(outpath, title=title, axes=True)
+                else:
+                    spec.save(outpath)
+            elif not os.path.exists(os.path.join(clipdir, filename)) or force:
+                # these libraries take nearly 1.0s to import, which makes the cli
+                # app seem very sluggish, so we'll only import them when necessary.
+                # no risk of duplicate imports as python should only return a
+                # reference to the first instance of an imported module.
+                import numpy as np
+                import librosa
+                import matplotlib
+                import matplotlib.pyplot as plt
+                from matplotlib.ticker import FormatStrFormatter as fsf
+
+                # Use high quality backend for rendering PNGs
+                matplotlib.use('agg')
 
-            if not os.path.exists(os.path.join(clipdir, filename)) or force:
                 # load audio file
                 hl = 32
                 wl = 512
 
-                # without sr= set, it resamples to 22050hz
-                # with sr=None set, it uses the native sampling rate
-                data, sr = librosa.load(os.path.join(clipdir, wavefile), sr=height)
+                # mix down to mono and resample the same way librosa.load would,
+                # without height set we keep the native sampling rate
+                data = samples.mean(axis=1)
+                sr = self.rate
+
+                if height:
+                    data = librosa.resample(data, orig_sr=sr, target_sr=height)
+                    sr = height
+
                 duration = len(data) / sr
 
                 db = librosa.amplitude_to_db(np.abs(librosa.stft(data, hop_length=hl, win_length=wl)), ref=np.max)
@@ -1093,6 +3213,193 @@ class TalonWAVFile:
                 if self._debug:
                     print('File exists, skipping. Use the --force option to regenerate the spectrograph.')
 
+class TalonSpectrogram:
+    """
+    A lightweight spectrograph renderer which computes the STFT with numpy and
+    writes a grayscale PNG directly, bypassing librosa and pyplot. The STFT
+    parameters mirror the matplotlib engine (hop 32, window 512, n_fft 2048
+    at 24kHz) and are scaled to the native rate rather than resampling.
+    """
+    REF_RATE = 24000
+    HOP_LENGTH = 32
+    WIN_LENGTH = 512
+    N_FFT = 2048
+    TOP_DB = 80.0
+    AMIN = 1e-5
+
+    # frames per FFT batch, bounds memory use on long windows
+    BATCH = 512
+
+    def __init__(self, samples, rate, max_freq=None):
+        """
+        Args:
+            samples (ndarray): Float samples, either (frames,) or (frames, channels).
+            rate (int): Sample rate of the supplied samples.
+            max_freq (int): Highest frequency to render (default: Nyquist).
+        """
+        import numpy as np
+
+        samples = np.asarray(samples, dtype=np.float32)
+
+        # librosa.load mixes down to mono by default, so we do the same
+        if samples.ndim > 1:
+            samples = samples.mean(axis=1)
+
+        self.samples = samples
+        self.rate = rate
+        self.max_freq = min(max_freq, rate / 2) if max_freq else rate / 2
+
+        scale = rate / self.REF_RATE
+        self.hop_length = max(int(round(self.HOP_LENGTH * scale)), 1)
+        self.win_length = max(int(round(self.WIN_LENGTH * scale)), 2)
+        self.n_fft = max(int(round(self.N_FFT * scale)), self.win_length)
+
+        self._db = None
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.rate
+
+    def compute(self):
+        """
+        Returns:
+            ndarray: dB values, (frequency bins, frames), lowest frequency first,
+            scaled the same way as librosa.amplitude_to_db(ref=np.max).
+        """
+        if self._db is not None:
+            return self._db
+
+        import numpy as np
+
+        n_fft = self.n_fft
+        bins = int(self.max_freq * n_fft / self.rate) + 1
+
+        # centered frames padded with zeros, as librosa.stft does by default
+        y = np.pad(self.samples, n_fft // 2)
+
+        if len(y) < n_fft:
+            y = np.pad(y, (0, n_fft - len(y)))
+
+        # librosa centers a hann window of win_length inside n_fft, which only
+        # shifts the phase, so we window just the non-zero part and let rfft
+        # zero-pad it back out to n_fft without changing the magnitudes
+        window = np.hanning(self.win_length + 1)[:-1].astype(np.float32)
+        lpad = (n_fft - self.win_length) // 2
+        count = (len(y) - n_fft) // self.hop_length + 1
+
+        frames = np.lib.stride_tricks.sliding_window_view(y[lpad:], self.win_length)[::self.hop_length][:count]
+        mag = np.empty((bins, count), dtype=np.float32)
+
+        for start in range(0, count, self.BATCH):
+            batch = frames[start:start + self.BATCH] * window
+            mag[:, start:start + len(batch)] = np.abs(np.fft.rfft(batch, n=n_fft, axis=1)[:, :bins]).T
+
+        db = 20.0 * np.log10(np.maximum(mag, self.AMIN))
+        db -= 20.0 * np.log10(max(float(mag.max()) if mag.size else 0.0, self.AMIN))
+        self._db = np.maximum(db, db.max() - self.TOP_DB) if db.size else db
+
+        return self._db
+
+    def to_pixels(self):
+        """
+        Map dB values onto an inverted grayscale colormap (gray_r), loudest is
+        black, with the highest frequency in the top row.
+        """
+        import numpy as np
+
+        db = self.compute()
+        pixels = np.clip(-db * (255.0 / self.TOP_DB), 0, 255).astype(np.uint8)
+
+        return np.ascontiguousarray(pixels[::-1])
+
+    def save(self, outpath, title=None, axes=False):
+        """
+        Write the spectrograph to a PNG file, optionally with a title and axes.
+        """
+        pixels = self.to_pixels()
+
+        if title or axes:
+            pixels = self._annotate(pixels, title, axes)
+
+        TalonSpectrogram.write_png(outpath, pixels)
+
+    def _annotate(self, pixels, title, axes):
+        # pillow is already required by matplotlib, and is only needed when
+        # rendering text, so we'll only import it when necessary.
+        import numpy as np
+        from PIL import Image, ImageDraw, ImageFont
+
+        height, width = pixels.shape
+
+        try:
+            font = ImageFont.load_default(size=24)
+            small = ImageFont.load_default(size=18)
+        except TypeError:
+            # pillow < 10.1 only has a fixed size bitmap font
+            font = small = ImageFont.load_default()
+
+        left, right, bottom = (110, 40, 90) if axes else (20, 20, 20)
+        top = 30 + 30 * len(title.strip().splitlines()) if title else 20
+
+        canvas = Image.new('L', (width + left + right, height + top + bottom), 255)
+        canvas.paste(Image.fromarray(pixels, 'L'), (left, top))
+        draw = ImageDraw.Draw(canvas)
+
+        if title:
+            draw.multiline_text((left + width / 2, 20), title.strip(), fill=0, font=font, anchor='ma', align='center')
+
+        if axes:
+            draw.rectangle((left - 1, top - 1, left + width, top + height), outline=0, width=2)
+
+            interval = 2000 if self.max_freq * 2 > 24000 else 1000
+
+            for freq in np.arange(0, self.max_freq + 1, interval):
+                y = top + height - 1 - int(freq / self.max_freq * (height - 1))
+                draw.line((left - 10, y, left, y), fill=0, width=2)
+                draw.text((left - 14, y), f"{freq / 1000:1.1f}k", fill=0, font=small, anchor='rm')
+
+            for sec in np.arange(0, self.duration + .001, .25):
+                x = left + int(sec / self.duration * (width - 1)) if self.duration else left
+                draw.line((x, top + height, x, top + height + 10), fill=0, width=2)
+                draw.text((x, top + height + 14), f"{sec:.2f}", fill=0, font=small, anchor='ma')
+
+            draw.text((left + width / 2, top + height + 50), 'Time (s)', fill=0, font=font, anchor='ma')
+
+            # draw the vertical label sideways and rotate it into place
+            label = Image.new('L', (height, 30), 255)
+            ImageDraw.Draw(label).text((height / 2, 0), 'Frequency (Hz)', fill=0, font=font, anchor='ma')
+            canvas.paste(label.rotate(90, expand=True), (0, top))
+
+        return np.asarray(canvas)
+
+    @staticmethod
+    def write_png(outpath, pixels, level=1):
+        """
+        Write an 8-bit grayscale image to a PNG file using only zlib.
+
+        Args:
+            outpath (str): Path to write the PNG to.
+            pixels (ndarray): (height, width) array of uint8 values.
+            level (int): zlib compression level, lower is faster.
+        """
+        import zlib
+        import numpy as np
+
+        height, width = pixels.shape
+
+        # every scanline is prefixed with its filter type, 0 is 'None'
+        raw = np.zeros((height, width + 1), dtype=np.uint8)
+        raw[:, 1:] = pixels
+
+        def chunk(tag, data):
+            return struct.pack('>L', len(data)) + tag + data + struct.pack('>L', zlib.crc32(tag + data) & 0xffffffff)
+
+        with open(outpath, 'wb') as o:
+            o.write(b'\x89PNG\r\n\x1a\n')
+            o.write(chunk(b'IHDR', struct.pack('>LLBBBBB', width, height, 8, 0, 0, 0, 0)))
+            o.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), level)))
+            o.write(chunk(b'IEND', b''))
+
 class TalonSchedule():
     def __init__(self, latitude, longitude, timezone, name, curdate, hours=-1, duration=3600, debug=False):
         self._timezone = timezone
@@ -1118,16 +3425,23 @@ class TalonSchedule():
         self._initial = True
 
     def initialize(self):
-        location=LocationInfo(name=self._name, timezone=self._timezone, latitude=self._latitude, longitude=self._longitude)
-
-        self.adawnloc = sun(location.observer, date=self._date, dawn_dusk_depression=18, tzinfo=self._curtz)['dawn'].replace(microsecond=0)
-        self.aduskloc = sun(location.observer, date=self._date, dawn_dusk_depression=18, tzinfo=self._curtz)['dusk'].replace(microsecond=0)
-        self.noonloc = dt.combine(self._date, time(12,0,0)).astimezone(self._curtz).replace(microsecond=0)
-        self.midnloc = dt.combine(self._date, time(0,0,0)).astimezone(self._curtz).replace(microsecond=0)
+        # the days are the station's, localizing a naive midnight with
+        # astimezone() would use the system's time zone instead and, if the
+        # two differ, never reach the next day
+        curdate = self._date.astimezone(self._curtz).date()
+
+        ephemeris = TalonEphemeris.shared()
+        times = ephemeris.get(self._latitude, self._longitude, self._timezone, curdate)
+
+        self.adawnloc = times['dawn']
+        self.aduskloc = times['dusk']
+        self.noonloc = dt.combine(curdate, time(12,0,0), tzinfo=self._curtz).replace(microsecond=0)
+        self.midnloc = dt.combine(curdate, time(0,0,0), tzinfo=self._curtz).replace(microsecond=0)
         
         if self._debug:
-            self.adawnutc = sun(location.observer, date=self._date, dawn_dusk_depression=18, tzinfo=self._utc)['dawn'].replace(microsecond=0)
-            self.aduskutc = sun(location.observer, date=self._date, dawn_dusk_depression=18, tzinfo=self._utc)['dusk'].replace(microsecond=0)
+            times = ephemeris.get(self._latitude, self._longitude, 'UTC', self._date)
+            self.adawnutc = times['dawn']
+            self.aduskutc = times['dusk']
             self.noonutc = dt.combine(self._date, time(12,0,0)).astimezone(self._utc).replace(microsecond=0)
             self.noonutc = dt.combine(self._date, time(12,0,0)).astimezone(self._curtz).replace(microsecond=0)
             self.midnutc = dt.combine(self._date, time(0,0,0)).astimezone(self._curtz).replace(microsecond=0)
@@ -1293,6 +3607,8 @@ class TalonWeather:
         self._list_stations()
 
     def _list_stations(self):
+        import requests
+
         try:
             # Using NOAA / NWS as a weather source
             # weather.gov data is based on grids (2.5km x 2.5km). the first call gets the grid
@@ -1431,6 +3747,8 @@ class TalonWeather:
         self._get_forecast(force)
 
     def _get_forecast(self, force=False):
+        import requests
+
         try:
             # Using NOAA / NWS as a weather source
             # weather.gov data is based on grids (2.5km x 2.5km). the first call gets the grid
@@ -1458,6 +3776,8 @@ class TalonWeather:
             raise TalonWeatherTimeoutError(f"Time out contacting weather.gov: {e}")
 
     def _get_observations(self, force=False):
+        import requests
+
         observation_url = None
 
         try: